@@ -0,0 +1,158 @@
+# spell-book - A GUI for managing spells in D&D 5e
+#    Copyright (C) 2023  briforsaur
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from functools import wraps
+from inspect import isgeneratorfunction
+
+# Upper bounds in milliseconds of the latency histogram buckets
+HISTOGRAM_BOUNDS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, float('inf')
+)
+
+
+class MethodStats:
+    '''Call count, latency histogram and row count of a single method.'''
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0]*len(HISTOGRAM_BOUNDS_MS)
+
+    def record(self, duration_ms: float, rows: int):
+        self.calls += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.rows += rows
+        self.histogram[bisect_left(HISTOGRAM_BOUNDS_MS, duration_ms)] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            'calls': self.calls,
+            'total_ms': self.total_ms,
+            'mean_ms': self.total_ms/self.calls if self.calls else 0.0,
+            'max_ms': self.max_ms,
+            'rows': self.rows,
+            'histogram': {
+                f'<={bound}ms': count 
+                for (bound, count) in zip(HISTOGRAM_BOUNDS_MS, self.histogram)
+                if count
+            },
+        }
+
+
+class DatabaseStats:
+    '''
+    Thread-safe performance counters for a SpellDataBase.
+
+    Per-method statistics are recorded by the wrappers that 
+    SpellDataBase.enable_instrumentation() installs around its methods,
+    see wrap_method(). The number of connections opened and 
+    transactions committed are counted with count().
+
+    If slow_query_ms is given, every query run with 
+    SpellDataBase.run_query that takes at least that many milliseconds
+    is added to slow_queries together with its parameters and its
+    EXPLAIN QUERY PLAN output. At most max_slow_queries are kept, the
+    oldest being discarded first.
+    '''
+    def __init__(self, slow_query_ms: float = None, 
+            max_slow_queries: int = 100):
+        self.slow_query_ms = slow_query_ms
+        self.max_slow_queries = max_slow_queries
+        self.methods: dict[str, MethodStats] = {}
+        self.counters: dict[str, int] = {
+            'connections_opened': 0, 'commits': 0, 'rollbacks': 0,
+            'write_retries': 0,
+        }
+        self.slow_queries: list[dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, method_name: str, duration_ms: float, rows: int = 0):
+        '''Records one call of a method.'''
+        with self._lock:
+            method_stats = self.methods.get(method_name)
+            if method_stats is None:
+                method_stats = self.methods[method_name] = MethodStats()
+            method_stats.record(duration_ms, rows)
+
+    def count(self, counter: str):
+        '''Increments one of the counters by one.'''
+        with self._lock:
+            self.counters[counter] += 1
+
+    def log_slow_query(self, query_str: str, parameters: tuple, 
+            duration_ms: float, query_plan: list[str]):
+        with self._lock:
+            self.slow_queries.append({
+                'sql': query_str,
+                'parameters': list(parameters),
+                'duration_ms': duration_ms,
+                'query_plan': query_plan,
+            })
+            del self.slow_queries[:-self.max_slow_queries]
+
+    def snapshot(self) -> dict:
+        '''Returns a copy of every statistic as a dictionary.'''
+        with self._lock:
+            return {
+                'methods': {
+                    name: method_stats.snapshot() 
+                    for (name, method_stats) in self.methods.items()
+                },
+                **self.counters,
+                'slow_queries': [dict(q) for q in self.slow_queries],
+            }
+
+    def wrap_method(self, method_name: str, method: Callable) -> Callable:
+        '''
+        Returns a wrapper of a bound method that records its calls.
+
+        The number of rows is the length of the result for methods that
+        return a container, and one for any other result except None.
+        Generator methods are timed from the first to the last item 
+        they produce, and their rows are the number of items.
+        '''
+        if isgeneratorfunction(method):
+            @wraps(method)
+            def generator_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                rows = 0
+                try:
+                    for item in method(*args, **kwargs):
+                        rows += 1
+                        yield item
+                finally:
+                    self.record(
+                        method_name, 
+                        (time.perf_counter() - start)*1000, rows
+                    )
+            return generator_wrapper
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            if hasattr(result, '__len__'):
+                rows = len(result)
+            else:
+                rows = int(result is not None)
+            self.record(method_name, (time.perf_counter() - start)*1000, rows)
+            return result
+        return wrapper
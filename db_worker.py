@@ -0,0 +1,133 @@
+# spell-book - A GUI for managing spells in D&D 5e
+#    Copyright (C) 2023  briforsaur
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import queue
+import traceback
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class DatabaseWorker:
+    '''
+    Runs database calls on a background thread for a Tkinter GUI.
+
+    Tkinter is not thread-safe and its main loop cannot process events 
+    while a callback is running, so a slow query run directly from a 
+    callback freezes the window. DatabaseWorker runs the calls on a 
+    single worker thread instead, which also keeps every write to the 
+    database in the order it was submitted. Each submitted call returns 
+    a concurrent.futures.Future.
+
+    The result of a call can be delivered back to the GUI by giving a 
+    callback when submitting it. Completed calls are collected by 
+    polling with the widget's after() method, so callbacks always run on
+    the Tkinter thread. Polling only happens while calls are 
+    outstanding.
+
+    Calls can be submitted with a key to mark requests that replace 
+    each other, such as re-running the spell list query each time the
+    filter changes. Submitting a call with the same key as an earlier 
+    call cancels the earlier call if it has not started yet, and drops
+    its result if it has.
+
+    Example:
+
+    worker = DatabaseWorker(root)
+    worker.submit(
+        spell_db.query_spells, level=3, key='spell_list', 
+        callback=show_spell_list
+    )
+    '''
+    def __init__(self, widget, poll_interval: int = 20):
+        '''
+        Creates a worker that delivers results through a widget.
+
+        widget can be any Tkinter widget, it is only used to schedule 
+        polling with after(). poll_interval is in milliseconds.
+        '''
+        self.widget = widget
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='DatabaseWorker'
+        )
+        self.completed = queue.Queue()
+        self.pending: dict[Future, tuple] = {}
+        self.latest: dict[Hashable, Future] = {}
+        self.after_id = None
+
+    def submit(self, function: Callable, *args, key: Hashable = None,
+            callback: Callable = None, error_callback: Callable = None,
+            **keywords) -> Future:
+        '''
+        Runs function(*args, **keywords) on the worker thread.
+
+        callback is called on the Tkinter thread with the return value 
+        of the function once it completes. If the function raises an 
+        exception, error_callback is called with the exception instead,
+        or the traceback is printed if there is no error_callback. 
+        Neither is called if the call is cancelled or superseded by a 
+        later call with the same key.
+        '''
+        if key is not None and key in self.latest:
+            self.latest[key].cancel()
+        future = self.executor.submit(function, *args, **keywords)
+        if key is not None:
+            self.latest[key] = future
+        self.pending[future] = (key, callback, error_callback)
+        future.add_done_callback(self.completed.put)
+        if self.after_id is None:
+            self.after_id = self.widget.after(self.poll_interval, self.poll)
+        return future
+
+    def poll(self):
+        '''Delivers the results of completed calls to their callbacks.'''
+        self.after_id = None
+        while True:
+            try:
+                future = self.completed.get_nowait()
+            except queue.Empty:
+                break
+            self.deliver(future)
+        if self.pending:
+            self.after_id = self.widget.after(self.poll_interval, self.poll)
+
+    def deliver(self, future: Future):
+        (key, callback, error_callback) = self.pending.pop(future)
+        if key is not None:
+            if self.latest.get(key) is not future:
+                # Superseded by a later call with the same key
+                return
+            del self.latest[key]
+        if future.cancelled():
+            return
+        exception = future.exception()
+        if exception is not None:
+            if error_callback is not None:
+                error_callback(exception)
+            else:
+                traceback.print_exception(exception)
+        elif callback is not None:
+            callback(future.result())
+
+    def shutdown(self, wait: bool = True):
+        '''
+        Stops the worker after the calls already submitted complete.
+
+        Results that have not been delivered yet are discarded.
+        '''
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.executor.shutdown(wait=wait)
@@ -17,14 +17,29 @@ import tkinter as tk
 import tkinter.ttk as ttk
 from spell_info import SpellInfo
 from spelldb import SpellDataBase
+from db_worker import DatabaseWorker
 
 
 class SpellFilterWindow(tk.Toplevel):
-    def __init__(self, parent, **keywords) -> None:
+    '''
+    A window for choosing the filters of the spell list.
+
+    If a spell database is given, each filter option shows the number of
+    spells that choosing it would give, and the number of spells that 
+    match the chosen filters is shown at the bottom of the window. The
+    counts are updated whenever an option changes. If a DatabaseWorker
+    is also given, the counts are computed on its thread.
+    '''
+    def __init__(self, parent, spell_db: SpellDataBase = None, 
+            db_worker: DatabaseWorker = None, **keywords) -> None:
         super().__init__(parent, **keywords)
         self.parent = parent
+        self.spell_db = spell_db
+        self.db_worker = db_worker
         self.title('Filter Spell List...')
         self.add_widgets()
+        if self.spell_db is not None:
+            self.update_counts()
 
     def add_widgets(self):
         self.btn_confirm = ttk.Button(
@@ -42,13 +57,20 @@ class SpellFilterWindow(tk.Toplevel):
         )
         self.chk_ritual_value = tk.IntVar(value=False)
         self.chk_ritual = ttk.Checkbutton(
-            self, text='Ritual', variable=self.chk_ritual_value
+            self, text='Ritual', variable=self.chk_ritual_value,
+            command=self.update_counts
         )
+        self.lbl_count = ttk.Label(self)
+        for frm_group in (self.frm_classes, self.frm_level, self.frm_school):
+            frm_group.cmb_options.bind(
+                '<<ComboboxSelected>>', self.update_counts
+            )
         # Placing the widgets on the grid
         self.frm_classes.grid(column=0, row=0, columnspan=3, padx=5, pady=5)
         self.frm_level.grid(column=0, row=1, columnspan=3, padx=5, pady=5)
         self.frm_school.grid(column=0, row=2, columnspan=3, padx=5, pady=5)
         self.chk_ritual.grid(column=0, row=3, columnspan=3, padx=5, pady=5)
+        self.lbl_count.grid(column=0, row=4, columnspan=3, padx=5, pady=5)
         self.btn_confirm.grid(column=1, row=5)
         self.btn_cancel.grid(column=2, row=5)
 
@@ -61,6 +83,38 @@ class SpellFilterWindow(tk.Toplevel):
         self.event_generate('<<ApplyFilter>>')
         self.dismiss()
 
+    def update_counts(self, event: tk.Event = None):
+        '''Recounts the spells for each option with the current filters.'''
+        if self.spell_db is None:
+            return
+        filter_state = self.get_filter_state()
+        filters = {
+            'class_dict': filter_state['Classes'],
+            'level': filter_state['Level'],
+            'school': filter_state['School'],
+            'ritual': filter_state['Ritual'],
+        }
+        if self.db_worker is None:
+            self.show_counts(self.spell_db.facet_counts(**filters))
+        else:
+            self.db_worker.submit(
+                self.spell_db.facet_counts, key='facet_counts', 
+                callback=self.show_counts, **filters
+            )
+
+    def show_counts(self, counts: dict):
+        # The window may have been closed while the counts were computed
+        if not self.winfo_exists():
+            return
+        self.frm_classes.set_counts(counts['classes'])
+        self.frm_level.set_counts({
+            SpellInfo.levels[level]: number 
+            for (level, number) in counts['levels'].items()
+        })
+        self.frm_school.set_counts(counts['schools'])
+        self.chk_ritual['text'] = 'Ritual ({})'.format(counts['ritual'])
+        self.lbl_count['text'] = '{} matching spells'.format(counts['total'])
+
     def get_filter_state(self) -> dict[str, str]:
         class_dict = {class_name: False for class_name in SpellInfo.classes}
         level = -1
@@ -116,6 +170,7 @@ class ComboBoxGroup(ttk.Frame):
     def __init__(self, parent, label: str, values: tuple[str], **keywords):
         super().__init__(parent, **keywords)
         self.parent = parent
+        self.values = values
         self.lbl_label = ttk.Label(self, text=label)
         self.cmb_options = ttk.Combobox(self)
         self.cmb_options['values'] = values
@@ -124,8 +179,22 @@ class ComboBoxGroup(ttk.Frame):
         self.lbl_label.grid(column=0, row=0, padx=5)
         self.cmb_options.grid(column=1, row=0)
 
+    def set_counts(self, counts: dict[str, int]):
+        '''
+        Shows a count next to each option in counts, like "Bard (12)".
+
+        Options without a count are shown unchanged. get_value still
+        returns the option without its count.
+        '''
+        current = self.cmb_options.current()
+        self.cmb_options['values'] = [
+            f'{value} ({counts[value]})' if value in counts else value
+            for value in self.values
+        ]
+        self.cmb_options.current(current)
+
     def get_value(self) -> str:
-        return self.cmb_options.get()
+        return self.values[self.cmb_options.current()]
 
 
 class _TestWindow(tk.Tk):
@@ -140,7 +209,7 @@ class _TestWindow(tk.Tk):
         self.lbl_output.pack()
 
     def open_filter_window(self):
-        self.filter_window = SpellFilterWindow(root)
+        self.filter_window = SpellFilterWindow(root, self.spell_db)
         self.filter_window.bind('<<ApplyFilter>>', self.filter_event_handler)
 
     def filter_event_handler(self, event: tk.Event):
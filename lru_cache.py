@@ -0,0 +1,116 @@
+# spell-book - A GUI for managing spells in D&D 5e
+#    Copyright (C) 2023  briforsaur
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+
+
+class LRUCache:
+    '''
+    A bounded, thread-safe cache that evicts the least recently used item.
+
+    The cache holds at most maxsize items; a maxsize of 0 disables the
+    cache entirely. The number of lookups that found an item (hits) and
+    that did not (misses) are counted for tuning the cache size.
+
+    The cache also keeps a generation number which is incremented every
+    time items are invalidated with pop, pop_many or clear. A value
+    that was read from its source while an invalidation happened may
+    already be out of date, so put only stores the value if the
+    generation has not changed since the caller started reading it:
+
+    generation = cache.generation
+    value = read_from_source(key)
+    cache.put(key, value, generation)
+    '''
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        '''Returns the cached value for key, or default if not cached.'''
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value, generation: int = None):
+        '''
+        Stores a value in the cache, evicting the oldest item if full.
+
+        If generation is given and no longer matches the cache's
+        generation, the value is not stored. See the class documentation
+        for details.
+        '''
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+            if generation is not None and generation != self.generation:
+                return
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        '''Removes a single key from the cache if it is present.'''
+        self.pop_many((key,))
+
+    def pop_many(self, keys: Iterable[Hashable]):
+        '''Removes every key in keys from the cache if present.'''
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        '''Removes every item from the cache.'''
+        with self._lock:
+            self.generation += 1
+            self._items.clear()
+
+    def items(self) -> list[tuple[Hashable, object]]:
+        '''
+        Returns a list of the cached keys and values.
+
+        Unlike get, this does not count as a use of the items, so it 
+        changes neither the eviction order nor the hit and miss counts.
+        '''
+        with self._lock:
+            return list(self._items.items())
+
+    def info(self) -> dict[str, int]:
+        '''Returns the hit and miss counts and the size of the cache.'''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._items),
+                'maxsize': self.maxsize,
+            }
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
@@ -0,0 +1,16 @@
+-- Rebuilds spell_classes so that deleting a spell cascades to its class
+-- relations. Databases created from the current schema already have the
+-- cascade, rebuilding the table again is harmless.
+CREATE TABLE spell_classes_new (
+    spell_id INTEGER,
+    class_id INTEGER,
+    FOREIGN KEY (spell_id) REFERENCES spells(spell_id) ON DELETE CASCADE,
+    FOREIGN KEY (class_id) REFERENCES classes(class_id)
+);
+
+INSERT INTO spell_classes_new (spell_id, class_id)
+    SELECT spell_id, class_id FROM spell_classes;
+
+DROP TABLE spell_classes;
+
+ALTER TABLE spell_classes_new RENAME TO spell_classes;
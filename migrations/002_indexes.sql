@@ -0,0 +1,12 @@
+-- Secondary indexes for the class relation lookups, the class JOIN in
+-- query_spells, ordering by name, and the level/school filters.
+CREATE INDEX IF NOT EXISTS spell_classes_spell_idx
+    ON spell_classes(spell_id, class_id);
+
+CREATE INDEX IF NOT EXISTS spell_classes_class_idx
+    ON spell_classes(class_id, spell_id);
+
+CREATE INDEX IF NOT EXISTS spells_name_idx ON spells(spell_name);
+
+CREATE INDEX IF NOT EXISTS spells_level_school_idx
+    ON spells(spell_level, spell_school);
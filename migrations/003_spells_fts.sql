@@ -0,0 +1,86 @@
+-- Full-text index over the text columns of the spells table. The index
+-- is an external content FTS5 table, so the text is not stored twice,
+-- and it is kept in sync with the spells table by triggers.
+CREATE VIRTUAL TABLE spells_fts USING fts5(
+    spell_name,
+    spell_description,
+    spell_materials,
+    spell_higher_levels,
+    content='spells',
+    content_rowid='spell_id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER spells_fts_insert AFTER INSERT ON spells BEGIN
+    INSERT INTO spells_fts (
+        rowid,
+        spell_name,
+        spell_description,
+        spell_materials,
+        spell_higher_levels
+    )
+    VALUES (
+        new.spell_id,
+        new.spell_name,
+        new.spell_description,
+        new.spell_materials,
+        new.spell_higher_levels
+    );
+END;
+
+CREATE TRIGGER spells_fts_delete AFTER DELETE ON spells BEGIN
+    INSERT INTO spells_fts (
+        spells_fts,
+        rowid,
+        spell_name,
+        spell_description,
+        spell_materials,
+        spell_higher_levels
+    )
+    VALUES (
+        'delete',
+        old.spell_id,
+        old.spell_name,
+        old.spell_description,
+        old.spell_materials,
+        old.spell_higher_levels
+    );
+END;
+
+CREATE TRIGGER spells_fts_update AFTER UPDATE OF
+        spell_name, spell_description, spell_materials, spell_higher_levels
+        ON spells BEGIN
+    INSERT INTO spells_fts (
+        spells_fts,
+        rowid,
+        spell_name,
+        spell_description,
+        spell_materials,
+        spell_higher_levels
+    )
+    VALUES (
+        'delete',
+        old.spell_id,
+        old.spell_name,
+        old.spell_description,
+        old.spell_materials,
+        old.spell_higher_levels
+    );
+    INSERT INTO spells_fts (
+        rowid,
+        spell_name,
+        spell_description,
+        spell_materials,
+        spell_higher_levels
+    )
+    VALUES (
+        new.spell_id,
+        new.spell_name,
+        new.spell_description,
+        new.spell_materials,
+        new.spell_higher_levels
+    );
+END;
+
+-- Indexing the spells that already exist
+INSERT INTO spells_fts (spells_fts) VALUES ('rebuild');
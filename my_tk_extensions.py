@@ -13,14 +13,12 @@
 #   
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-from cgitb import text
 import tkinter as tk
 import tkinter.ttk as ttk
+from itertools import chain
 from typing import Dict, List, Tuple
 from tkinter import font as tkFont
-
-TagRange = list[str,str]
-TagDict = dict[str,list[TagRange]]
+from text_tags import TagRange, TagDict, TagSpans
 
 
 class ExtendedTextBox(tk.Text):
@@ -33,6 +31,10 @@ class ExtendedTextBox(tk.Text):
 
     apply_text_tags(tag_list)
 
+    extract_text_spans()
+
+    apply_text_spans(spans)
+
     update_text_box(new_text, keep_tags)
 
     ExtendedTextBox also configures some tags to format text more 
@@ -91,17 +93,28 @@ class ExtendedTextBox(tk.Text):
         
         In the example, the 'bold' tag has been applied to two text 
         ranges, (1.0 to 1.5 and 2.0 to 2.7) while the 'centering' tag 
-        has been applied to a single range.
+        has been applied to a single range. Tags which are not applied 
+        to any text are left out.
+
+        All of the tags are read with a single dump of the tag 
+        transitions, rather than asking Tk for the ranges of each tag.
         '''
-        tag_names = list(self.tag_names())
-        tag_names.remove('sel')
         saved_tags = {}
-        for tag in tag_names:
-            tag_ranges = self.tag_ranges(tag)
-            grouped_tags = [
-                [str(start_index), str(end_index)] for (start_index, end_index) 
-                in zip(tag_ranges[::2],tag_ranges[1::2])]
-            saved_tags.update({tag: grouped_tags})
+        open_tags = {}
+        for (transition, tag, index) in self.dump('1.0', 'end', tag=True):
+            if tag == 'sel':
+                continue
+            if transition == 'tagon':
+                open_tags[tag] = index
+            else:
+                saved_tags.setdefault(tag, []).append(
+                    [open_tags.pop(tag), index]
+                )
+        # The dump stops before 'end', so tags which include the final 
+        # newline are never switched off
+        end_index = self.index('end')
+        for (tag, start_index) in open_tags.items():
+            saved_tags.setdefault(tag, []).append([start_index, end_index])
         return saved_tags
     
     def apply_text_tags(self, tag_dict: TagDict):
@@ -122,11 +135,41 @@ class ExtendedTextBox(tk.Text):
         In the example, the 'bold' tag will be applied to two text 
         ranges, (1.0 to 1.5 and 2.0 to 2.7) while the 'centering' tag 
         will be applied to a single range.
+
+        All of the ranges of a tag are added with a single "tag add" 
+        command, which is much faster than adding them one at a time 
+        when there are many ranges.
+        '''
+        for (tag, tag_ranges) in tag_dict.items():
+            if tag_ranges:
+                self.tag_add(tag, *chain.from_iterable(tag_ranges))
+
+    def extract_text_spans(self) -> TagSpans:
+        '''
+        Extract all tags except "sel" as character offsets.
+
+        This is the TagSpans equivalent of extract_text_tags, with the
+        offsets counted from the start of the text box.
         '''
-        for tag in tag_dict.keys():
-            tag_ranges = tag_dict[tag]
-            for tag_range in tag_ranges:
-                self.tag_add(tag, tag_range[0], tag_range[1])
+        text = self.get('1.0', 'end-1c')
+        return TagSpans.from_tag_dict(text, self.extract_text_tags())
+
+    def apply_text_spans(self, spans: TagSpans, start: str = '1.0'):
+        '''
+        Apply TagSpans to this text box.
+
+        The offsets of the spans are counted in characters from the 
+        index start, so spans for text inserted in the middle of the 
+        text box can be applied without shifting them. Tk converts the 
+        offsets to line and character positions itself, using indices 
+        such as '1.0+114c'. As in apply_text_tags, all of the ranges of
+        a tag are added with a single command.
+        '''
+        for (tag, offsets) in spans.items():
+            if offsets:
+                self.tag_add(
+                    tag, *[f'{start}+{offset}c' for offset in offsets]
+                )
 
     def update_text_box(
             self, new_text: str, keep_tags = False, allow_editing = False):
@@ -212,6 +255,249 @@ class TextEditor(ttk.Frame):
         self.txt_editor.focus_set() # returns focus to the text widgets
 
 
+class VirtualListbox(ttk.Frame):
+    '''
+    A scrollable list that only creates rows for the visible items.
+
+    A normal Listbox holds every item, which becomes slow to fill and 
+    update when there are tens of thousands of them. VirtualListbox 
+    instead keeps a Listbox exactly as tall as its visible area and 
+    refills it with the visible slice of a model whenever the view 
+    scrolls. The model can be any object that supports:
+
+    len(model) - the total number of items
+
+    model.rows(start, stop) - a list of the items at positions start to 
+        stop - 1
+
+    Reading rows that are not in memory, for example from a database, 
+    would make scrolling wait for them. For such models, give a 
+    load_rows function and have the model also support:
+
+    model.cached_rows(start, stop) - like rows, but only returning the 
+        items already in memory, with None in place of the others
+
+    The missing items are shown as placeholder text and load_rows(start,
+    stop) is called so that the owner can read them in the background 
+    and call refresh() once they are available.
+
+    The scrollbar, mouse wheel, and the arrow, Page Up/Down, Home and 
+    End keys are handled by VirtualListbox so that they move through the
+    whole model rather than the visible rows.
+
+    Like a Listbox, VirtualListbox generates a <<ListboxSelect>> event 
+    when the user changes the selection, and also when select() is 
+    called. The selected item can be read with get_selected_item(). If 
+    the selected item has not been loaded yet, the event is generated 
+    by the refresh() that shows it.
+    '''
+    placeholder = '...'
+
+    def __init__(self, parent, model = None, item_text = str, 
+            load_rows = None, **keywords):
+        '''
+        Constructs a new virtual list.
+
+        item_text is a function that converts an item of the model to 
+        the string displayed for it. load_rows is the function called 
+        with the positions of missing rows, see the class documentation.
+        The remaining keywords are passed to the Listbox.
+        '''
+        super().__init__(parent)
+        self.parent = parent
+        self.model = model
+        self.item_text = item_text
+        self.load_rows = load_rows
+        self.top = 0
+        self.selected = None
+        # Set when the selected item is waiting to be loaded
+        self.selection_pending = False
+        self.visible_rows = 1
+        self.visible_items = []
+        self.add_widgets(**keywords)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.render()
+
+    def add_widgets(self, **keywords):
+        self.lstbx_items = tk.Listbox(self, exportselection=False, **keywords)
+        self.scrlbr_items = ttk.Scrollbar(
+            self, orient=tk.VERTICAL, command=self.scrollbar_callback
+        )
+        self.lstbx_items.bind('<<ListboxSelect>>', self.listbox_select)
+        self.lstbx_items.bind('<Configure>', self.resize)
+        self.lstbx_items.bind('<MouseWheel>', self.mouse_wheel)
+        self.lstbx_items.bind('<Button-4>', self.mouse_wheel)
+        self.lstbx_items.bind('<Button-5>', self.mouse_wheel)
+        self.lstbx_items.bind('<Up>', lambda e: self.move_selection(-1))
+        self.lstbx_items.bind('<Down>', lambda e: self.move_selection(1))
+        self.lstbx_items.bind(
+            '<Prior>', lambda e: self.move_selection(-self.visible_rows)
+        )
+        self.lstbx_items.bind(
+            '<Next>', lambda e: self.move_selection(self.visible_rows)
+        )
+        self.lstbx_items.bind('<Home>', lambda e: self.select(0))
+        self.lstbx_items.bind(
+            '<End>', lambda e: self.select(self.length() - 1)
+        )
+        # Placing the widgets on the grid
+        self.lstbx_items.grid(column=0, row=0, sticky='nsew')
+        self.scrlbr_items.grid(column=1, row=0, sticky='ns')
+
+    def length(self) -> int:
+        return len(self.model) if self.model is not None else 0
+
+    def set_model(self, model):
+        '''Replaces the model, scrolls to the top and clears the selection.'''
+        self.model = model
+        self.top = 0
+        self.selected = None
+        self.selection_pending = False
+        self.render()
+
+    def refresh(self):
+        '''Redraws the visible items after the model has changed.'''
+        self.render()
+        if self.selection_pending and self.get_selected_item() is not None:
+            self.selection_pending = False
+            self.event_generate('<<ListboxSelect>>')
+
+    def get_rows(self, start: int, stop: int, load: bool = True) -> list:
+        '''
+        Returns the items at positions start to stop - 1.
+
+        If the model has rows that are not loaded, None is returned in 
+        their place and, if load is True, load_rows is asked to load 
+        them.
+        '''
+        if self.load_rows is None or not hasattr(self.model, 'cached_rows'):
+            return self.model.rows(start, stop)
+        rows = self.model.cached_rows(start, stop)
+        if load and None in rows:
+            self.load_rows(start, stop)
+        return rows
+
+    def render(self):
+        length = self.length()
+        self.top = max(0, min(self.top, length - self.visible_rows))
+        if length:
+            self.visible_items = self.get_rows(
+                self.top, self.top + self.visible_rows
+            )
+        else:
+            self.visible_items = []
+        self.lstbx_items.delete(0, 'end')
+        if self.visible_items:
+            self.lstbx_items.insert(0, *[
+                self.placeholder if item is None else self.item_text(item)
+                for item in self.visible_items
+            ])
+        if (self.selected is not None 
+                and 0 <= self.selected - self.top < len(self.visible_items)):
+            self.lstbx_items.selection_set(self.selected - self.top)
+            self.lstbx_items.activate(self.selected - self.top)
+        if length:
+            self.scrlbr_items.set(
+                self.top/length, 
+                min(1.0, (self.top + self.visible_rows)/length)
+            )
+        else:
+            self.scrlbr_items.set(0.0, 1.0)
+
+    def resize(self, event: tk.Event):
+        # Tk listbox lines are one pixel taller than the font linespace,
+        # plus the selection border above and below
+        line_font = tkFont.Font(font=self.lstbx_items.cget('font'))
+        line_height = (line_font.metrics('linespace') + 1
+            + 2*int(self.lstbx_items.cget('selectborderwidth')))
+        border = 2*(int(self.lstbx_items.cget('borderwidth'))
+            + int(self.lstbx_items.cget('highlightthickness')))
+        visible_rows = max(1, (event.height - border)//line_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()
+
+    def scroll_to(self, top: int):
+        '''Scrolls the view so that the item at position top is first.'''
+        self.top = top
+        self.render()
+
+    def see(self, index: int):
+        '''Scrolls the view as little as needed to show an item.'''
+        top = self.top_showing(index)
+        if top != self.top:
+            self.scroll_to(top)
+
+    def top_showing(self, index: int) -> int:
+        '''Returns the closest top position at which an item is visible.'''
+        if index < self.top:
+            return index
+        if index >= self.top + self.visible_rows:
+            return index - self.visible_rows + 1
+        return self.top
+
+    def scrollbar_callback(self, action: str, amount: str, unit: str = None):
+        if action == 'moveto':
+            self.scroll_to(int(float(amount)*self.length()))
+        elif unit == 'pages':
+            self.scroll_to(self.top + int(amount)*self.visible_rows)
+        else:
+            self.scroll_to(self.top + int(amount))
+
+    def mouse_wheel(self, event: tk.Event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.top - 3)
+        else:
+            self.scroll_to(self.top + 3)
+        return 'break'
+
+    def listbox_select(self, event: tk.Event):
+        selected_rows = self.lstbx_items.curselection()
+        if selected_rows:
+            self.selected = self.top + selected_rows[0]
+            self.selection_changed()
+
+    def selection_changed(self):
+        # Waiting for a placeholder row to load before announcing it
+        self.selection_pending = (
+            self.selected is not None and self.get_selected_item() is None)
+        if not self.selection_pending:
+            self.event_generate('<<ListboxSelect>>')
+
+    def move_selection(self, step: int):
+        if self.selected is None:
+            index = self.top if step > 0 else self.top + self.visible_rows - 1
+        else:
+            index = self.selected + step
+        self.select(index)
+        return 'break'
+
+    def select(self, index: int):
+        '''
+        Selects the item at a position and scrolls it into view.
+
+        The position is clamped to the model. Generates a 
+        <<ListboxSelect>> event.
+        '''
+        length = self.length()
+        if length:
+            self.selected = max(0, min(index, length - 1))
+            # Scrolled here rather than with see() to render only once
+            self.top = self.top_showing(self.selected)
+        else:
+            self.selected = None
+        self.render()
+        self.selection_changed()
+        return 'break'
+
+    def get_selected_item(self):
+        '''Returns the selected item, or None if it is not loaded.'''
+        if self.selected is None or self.selected >= self.length():
+            return None
+        return self.get_rows(self.selected, self.selected + 1, False)[0]
+
+
 def shift_tag_range(
         tag_range: TagRange, line_shift: int, char_shift: int) -> TagRange:
     """
@@ -0,0 +1,414 @@
+# spell-book - A GUI for managing spells in D&D 5e
+#    Copyright (C) 2023  briforsaur
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+Benchmarks the SpellDataBase with synthetic spells.
+
+For each database size, a new database is filled with deterministic 
+synthetic spells and each SpellDataBase operation is timed. The results
+are written as JSON so that runs can be compared between releases to 
+find performance regressions.
+
+With --render-tags, the time taken to apply and extract formatting tags
+in an ExtendedTextBox is also measured for each number of tag ranges. 
+This benchmark needs a display, so tkinter is only imported when it is
+requested.
+
+Example usage:
+
+python spell_benchmark.py --sizes 1000 100000 --output results.json
+python spell_benchmark.py --sizes --render-tags 10 100 1000 10000
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from datetime import datetime, timezone
+
+from spell_info import SpellInfo
+from spelldb import SpellDataBase
+from text_tags import TagSpans
+
+SCHEMA_FILENAME = os.path.join(os.path.dirname(__file__), 'spell_db_schema.sql')
+
+WORDS = (
+    'arcane', 'blade', 'creature', 'damage', 'target', 'spell', 'range',
+    'radiant', 'necrotic', 'fire', 'cold', 'lightning', 'thunder', 'acid',
+    'poison', 'psychic', 'force', 'saving', 'throw', 'strength', 'dexterity',
+    'constitution', 'intelligence', 'wisdom', 'charisma', 'hit', 'points',
+    'temporary', 'duration', 'concentration', 'sphere', 'cone', 'line',
+    'cube', 'cylinder', 'radius', 'feet', 'you', 'choose', 'point', 'within',
+    'each', 'must', 'make', 'on', 'a', 'failed', 'save', 'or', 'half', 'as',
+    'much', 'successful', 'one', 'the', 'of', 'and', 'to', 'in', 'that',
+)
+NAME_PARTS = (
+    ('Arcane', 'Blazing', 'Chilling', 'Divine', 'Eldritch', 'Faerie',
+        'Greater', 'Hungry', 'Lesser', 'Mystic', 'Phantom', 'Searing',
+        'Shadow', 'Silent', 'Storm', 'Thundering', 'Verdant', 'Withering'),
+    ('Arrow', 'Aura', 'Barrier', 'Blade', 'Bolt', 'Chains', 'Cloud', 'Sphere',
+        'Grasp', 'Hand', 'Lance', 'Mantle', 'Orb', 'Shield', 'Step', 'Ward',
+        'Wave', 'Word'),
+)
+DURATIONS = (
+    'Instantaneous', '1 round', '1 minute', '10 minutes', '1 hour', 
+    '8 hours', '24 hours', 'Until dispelled'
+)
+RANGES = ('Self', 'Touch', '30 feet', '60 feet', '90 feet', '120 feet')
+CAST_TIMES = (
+    ('reaction', 1), ('bonus action', 1), ('action', 1), ('minutes', 1),
+    ('minutes', 10), ('hours', 1), ('hours', 8)
+)
+# Most spells are on the lists of one or two classes, a few on many
+CLASS_COUNT_WEIGHTS = (40, 30, 15, 10, 5)
+
+
+def class_dict(*class_names: str) -> dict[str, bool]:
+    '''
+    Creates a class filter selecting only the named classes.
+
+    Every class must be in the dictionary, since a filter with all of 
+    its classes selected does not filter anything.
+    '''
+    return {c: c in class_names for c in SpellInfo.classes}
+
+
+FILTERS = {
+    'none': {},
+    'class': {'class_dict': class_dict('Wizard')},
+    'classes': {'class_dict': class_dict('Cleric', 'Druid')},
+    'level': {'level': 3},
+    'school': {'school': 'Evocation'},
+    'ritual': {'ritual': 1},
+    'class_level': {'class_dict': class_dict('Wizard'), 'level': 3},
+    'all': {
+        'class_dict': class_dict('Wizard'), 'level': 3, 
+        'school': 'Evocation', 'ritual': 1
+    },
+}
+
+
+def synthetic_text(rng: random.Random, min_words: int, max_words: int
+        ) -> str:
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    text = ' '.join(words)
+    return text[0].upper() + text[1:] + '.'
+
+
+def synthetic_tags(rng: random.Random, text: str, max_tags: int) -> dict:
+    '''Creates bold and italic tags over random words of one-line text.'''
+    tag_dict = {}
+    for _ in range(rng.randint(0, max_tags)):
+        start = rng.randrange(len(text))
+        end = min(len(text), start + rng.randint(3, 30))
+        tag = rng.choice(('bold', 'italic', 'bolditalic'))
+        tag_dict.setdefault(tag, []).append([f'1.{start}', f'1.{end}'])
+    return tag_dict
+
+
+def synthetic_spells(count: int, seed: int = 0) -> Iterator[SpellInfo]:
+    '''
+    Generates count synthetic spells, the same ones for the same seed.
+
+    The spells have unique names, descriptions of a few dozen to a few 
+    hundred words with formatting tags, and are on the lists of one to
+    five classes.
+    '''
+    rng = random.Random(seed)
+    for i in range(count):
+        name = '{} {} {}'.format(
+            rng.choice(NAME_PARTS[0]), rng.choice(NAME_PARTS[1]), i
+        )
+        description = synthetic_text(rng, 30, 400)
+        materials = ''
+        components = {
+            'V': rng.random() < 0.9, 'S': rng.random() < 0.8,
+            'M': rng.random() < 0.5
+        }
+        if components['M']:
+            materials = synthetic_text(rng, 3, 20)
+        higher_levels = ''
+        if rng.random() < 0.4:
+            higher_levels = synthetic_text(rng, 15, 60)
+        class_count = rng.choices(
+            range(1, len(CLASS_COUNT_WEIGHTS) + 1), CLASS_COUNT_WEIGHTS
+        )[0]
+        classes = rng.sample(SpellInfo.classes, class_count)
+        (cast_unit, cast_quantity) = rng.choice(CAST_TIMES)
+        yield SpellInfo(
+            name=name,
+            level=rng.randint(0, 9),
+            school=rng.choice(SpellInfo.schools),
+            ritual=rng.random() < 0.1,
+            cast_time=SpellInfo.value_from_cast_time(cast_quantity, cast_unit),
+            range=rng.choice(RANGES),
+            concentration=rng.random() < 0.4,
+            duration=rng.choice(DURATIONS),
+            components=components,
+            materials=materials,
+            materials_tags=synthetic_tags(rng, materials, 1) if materials else {},
+            description=description,
+            description_tags=synthetic_tags(rng, description, 6),
+            higher_levels=higher_levels,
+            higher_levels_tags=(
+                synthetic_tags(rng, higher_levels, 2) if higher_levels else {}),
+            in_class_spell_list={
+                class_name: class_name in classes 
+                for class_name in SpellInfo.classes
+            }
+        )
+
+
+def time_calls(function: Callable, arguments: list) -> list[float]:
+    '''Calls function once for each item of arguments, timing each call.'''
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(operation: str, size: int, timings: list[float], 
+        rows: int = None) -> dict:
+    timings_ms = sorted(t*1000 for t in timings)
+    result = {
+        'operation': operation,
+        'size': size,
+        'calls': len(timings_ms),
+        'total_s': sum(timings_ms)/1000,
+        'mean_ms': statistics.fmean(timings_ms),
+        'median_ms': statistics.median(timings_ms),
+        'p95_ms': timings_ms[int(0.95*(len(timings_ms) - 1))],
+        'min_ms': timings_ms[0],
+        'max_ms': timings_ms[-1],
+    }
+    if rows is not None:
+        result['rows'] = rows
+    return result
+
+
+def benchmark_size(size: int, samples: int, repeat: int, seed: int,
+        directory: str) -> list[dict]:
+    '''Runs every benchmark on a new database of size spells.'''
+    results = []
+    filename = os.path.join(directory, f'benchmark_{size}.sqlite3')
+    # The caches are disabled so that get_spell and query_spells
+    # measure the database
+    spell_db = SpellDataBase(
+        filename, SCHEMA_FILENAME, cache_size=0, query_cache_size=0
+    )
+    rng = random.Random(seed)
+
+    start = time.perf_counter()
+    spell_ids = spell_db.add_spells(synthetic_spells(size, seed))
+    results.append(
+        summarize('add_spells', size, [time.perf_counter() - start], size)
+    )
+
+    extra_spells = list(synthetic_spells(samples, seed + 1))
+    for spell in extra_spells:
+        spell.name = 'Extra ' + spell.name
+    timings = time_calls(spell_db.add_spell, extra_spells)
+    results.append(summarize('add_spell', size, timings))
+
+    sample_ids = rng.sample(spell_ids, min(samples, len(spell_ids)))
+    timings = time_calls(spell_db.get_spell, sample_ids)
+    results.append(summarize('get_spell', size, timings))
+
+    start = time.perf_counter()
+    for _ in spell_db.get_spells(sample_ids):
+        pass
+    results.append(summarize(
+        'get_spells', size, [time.perf_counter() - start], len(sample_ids)
+    ))
+
+    start = time.perf_counter()
+    for _ in spell_db.get_spell_summaries(sample_ids):
+        pass
+    results.append(summarize(
+        'get_spell_summaries', size, [time.perf_counter() - start], 
+        len(sample_ids)
+    ))
+
+    timings = time_calls(lambda _: spell_db.get_spell_list(), range(repeat))
+    results.append(summarize('get_spell_list', size, timings, size + samples))
+
+    for (filter_name, spell_filter) in FILTERS.items():
+        rows = len(spell_db.query_spells(**spell_filter))
+        timings = time_calls(
+            lambda _: spell_db.query_spells(**spell_filter), range(repeat)
+        )
+        results.append(summarize(
+            'query_spells:' + filter_name, size, timings, rows
+        ))
+
+    updated_spells = list(synthetic_spells(len(sample_ids), seed + 2))
+    timings = time_calls(
+        lambda item: spell_db.update_spell(*item), 
+        [(spell_id, spell) for (spell_id, spell) 
+            in zip(sample_ids, updated_spells)]
+    )
+    results.append(summarize('update_spell', size, timings))
+
+    timings = time_calls(spell_db.del_spell, sample_ids)
+    results.append(summarize('del_spell', size, timings))
+
+    spell_db.close()
+    return results
+
+
+def synthetic_spans(rng: random.Random, text: str, count: int) -> TagSpans:
+    '''Creates count bold, italic and bolditalic ranges over text.'''
+    spans = TagSpans()
+    tags = ('bold', 'italic', 'bolditalic')
+    for (i, start) in enumerate(sorted(rng.sample(range(len(text)), count))):
+        # Ranges of the same tag never overlap, so Tk keeps all of them
+        spans.add(tags[i % 3], start, start + 1)
+    return spans
+
+
+def benchmark_render(tag_counts: list[int], repeat: int, 
+        seed: int) -> list[dict]:
+    '''
+    Times applying and extracting tags in an ExtendedTextBox.
+
+    Each number of tag ranges is applied to a text long enough to hold 
+    them. The batched apply_text_tags and apply_text_spans are compared
+    with adding the ranges one "tag add" command at a time, as 
+    apply_text_tags used to. The time includes the idle tasks that lay 
+    out the tagged text.
+    '''
+    import tkinter as tk
+    from my_tk_extensions import ExtendedTextBox
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        raise RuntimeError(f'the rendering benchmark needs a display: {e}')
+    root.withdraw()
+    text_box = ExtendedTextBox(root)
+    rng = random.Random(seed)
+    results = []
+
+    def clear_and_time(function, argument) -> list[float]:
+        timings = []
+        for _ in range(repeat):
+            for tag in text_box.tag_names():
+                text_box.tag_remove(tag, '1.0', 'end')
+            text_box.update_idletasks()
+            start = time.perf_counter()
+            function(argument)
+            text_box.update_idletasks()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def apply_one_at_a_time(tag_dict: dict):
+        for (tag, tag_ranges) in tag_dict.items():
+            for (start, end) in tag_ranges:
+                text_box.tag_add(tag, start, end)
+
+    for count in tag_counts:
+        lines = [synthetic_text(rng, 12, 12) for _ in range(max(1, count//4))]
+        text = '\n'.join(lines)
+        text_box.update_text_box(text)
+        spans = synthetic_spans(rng, text, min(count, len(text)))
+        tag_dict = spans.to_tag_dict(text)
+        for (operation, function, argument) in (
+                ('tag_add_per_range', apply_one_at_a_time, tag_dict),
+                ('apply_text_tags', text_box.apply_text_tags, tag_dict),
+                ('apply_text_spans', text_box.apply_text_spans, spans)):
+            results.append(summarize(
+                'render:' + operation, count, 
+                clear_and_time(function, argument), count
+            ))
+        text_box.apply_text_spans(spans)
+        for (operation, function) in (
+                ('extract_text_tags', text_box.extract_text_tags),
+                ('extract_text_spans', text_box.extract_text_spans)):
+            timings = time_calls(lambda _: function(), range(repeat))
+            results.append(summarize('render:' + operation, count, timings))
+
+    root.destroy()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--sizes', type=int, nargs='*', default=[1000, 100000, 1000000],
+        help='numbers of spells in the benchmark databases'
+    )
+    parser.add_argument(
+        '--render-tags', type=int, nargs='+', default=[],
+        help='numbers of tag ranges in the text rendering benchmark, '
+        'which needs a display'
+    )
+    parser.add_argument(
+        '--samples', type=int, default=200,
+        help='number of spells read, added, updated and deleted one at a time'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of times each whole-list query is repeated'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--output', default='-', help='JSON output file, - for stdout'
+    )
+    args = parser.parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            print(f'Benchmarking {size} spells...', file=sys.stderr)
+            results.extend(benchmark_size(
+                size, args.samples, args.repeat, args.seed, directory
+            ))
+    if args.render_tags:
+        print('Benchmarking tag rendering...', file=sys.stderr)
+        try:
+            results.extend(
+                benchmark_render(args.render_tags, args.repeat, args.seed)
+            )
+        except (ImportError, RuntimeError) as e:
+            parser.error(str(e))
+    report = {
+        'metadata': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'samples': args.samples,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
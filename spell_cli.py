@@ -0,0 +1,360 @@
+# spell-book - A GUI for managing spells in D&D 5e
+#    Copyright (C) 2023  briforsaur
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+A command-line interface to the spell database that does not need Tk.
+
+The spells are read from the database and written to the output one at
+a time, so even very large databases can be queried or exported 
+without holding every spell in memory. This module must not import 
+tkinter, directly or indirectly, so that it starts quickly and runs on
+machines without a display.
+
+Example usage:
+
+python spell_cli.py query --class Wizard --level 3 --format csv
+python spell_cli.py show "Armor of Agathys"
+python spell_cli.py export --output spells.jsonl
+python spell_cli.py --database new.sqlite3 import spells.jsonl
+'''
+import argparse
+import csv
+import json
+import os
+import sys
+from collections.abc import Iterable, Iterator
+from typing import TextIO
+
+from spell_info import SpellInfo, SpellSummary
+from spelldb import SpellDataBase
+
+DEFAULT_DATABASE = 'phb_5e_spells.sqlite3'
+SCHEMA_FILENAME = os.path.join(os.path.dirname(__file__), 'spell_db_schema.sql')
+FORMATS = ('jsonl', 'csv')
+SUMMARY_FIELDS = (
+    'spell_id', 'name', 'level', 'school', 'ritual', 'cast_time', 'range', 
+    'concentration', 'duration', 'components', 'classes'
+)
+SPELL_FIELDS = (
+    'name', 'level', 'school', 'ritual', 'cast_time', 'range', 
+    'concentration', 'duration', 'components', 'materials', 
+    'materials_tags', 'description', 'description_tags', 'higher_levels',
+    'higher_levels_tags', 'classes'
+)
+TAG_FIELDS = ('materials_tags', 'description_tags', 'higher_levels_tags')
+
+
+def summary_to_record(summary: SpellSummary) -> dict:
+    return {
+        'spell_id': summary.spell_id,
+        'name': summary.name,
+        'level': summary.level,
+        'school': summary.school,
+        'ritual': summary.ritual,
+        'cast_time': summary.get_cast_time_as_str(),
+        'range': summary.range,
+        'concentration': summary.concentration,
+        'duration': summary.duration,
+        'components': summary.get_vsm_components_as_string(),
+        'classes': summary.get_classes_as_list(),
+    }
+
+
+def spell_to_record(spell: SpellInfo) -> dict:
+    '''
+    Converts a spell to a dictionary of the values written by export.
+
+    The components are written as a string such as 'VSM', the classes 
+    as a list of class names, the tags as lists of character offsets 
+    (see TagSpans), and the cast time as its numerical value so that 
+    it can be imported again exactly.
+    '''
+    return {
+        'name': spell.name,
+        'level': spell.level,
+        'school': spell.school,
+        'ritual': bool(spell.ritual),
+        'cast_time': spell.cast_time,
+        'range': spell.range,
+        'concentration': bool(spell.concentration),
+        'duration': spell.duration,
+        'components': spell.get_vsm_components_as_string(),
+        'materials': spell.materials,
+        'materials_tags': spell.materials_tags.to_dict(),
+        'description': spell.description,
+        'description_tags': spell.description_tags.to_dict(),
+        'higher_levels': spell.higher_levels,
+        'higher_levels_tags': spell.higher_levels_tags.to_dict(),
+        'classes': spell.get_classes_as_list(),
+    }
+
+
+def record_to_spell(record: dict) -> SpellInfo:
+    '''
+    Converts a record read by import back to a SpellInfo.
+
+    Records read from CSV files contain only strings, so every value is
+    converted to the type SpellInfo expects. Records read from JSON 
+    Lines files may already have the right types. The tags may be in 
+    any format SpellInfo accepts, including the Tk indices written by
+    older versions.
+    '''
+    classes = record['classes']
+    if isinstance(classes, str):
+        classes = [name.strip() for name in classes.split(',')]
+    tags = {field: record.get(field) or {} for field in TAG_FIELDS}
+    return SpellInfo(
+        name=record['name'],
+        level=int(record['level']),
+        school=record['school'],
+        ritual=parse_bool(record['ritual']),
+        cast_time=float(record['cast_time']),
+        range=record['range'],
+        concentration=parse_bool(record['concentration']),
+        duration=record['duration'],
+        components={
+            component: component in record['components'] 
+            for component in 'VSM'
+        },
+        materials=record.get('materials', ''),
+        materials_tags=tags['materials_tags'],
+        description=record.get('description', ''),
+        description_tags=tags['description_tags'],
+        higher_levels=record.get('higher_levels', ''),
+        higher_levels_tags=tags['higher_levels_tags'],
+        in_class_spell_list={
+            class_name: class_name in classes 
+            for class_name in SpellInfo.classes
+        },
+    )
+
+
+def parse_bool(value: bool | str) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def write_records(records: Iterable[dict], fields: tuple[str], 
+        output_format: str, output: TextIO) -> int:
+    '''
+    Writes records one at a time as JSON Lines or CSV.
+
+    In CSV files, lists are written as comma-separated strings, 
+    dictionaries as JSON, and booleans as 1 or 0. Returns the number of
+    records written.
+    '''
+    number = 0
+    if output_format == 'csv':
+        writer = csv.DictWriter(output, fields, lineterminator='\n')
+        writer.writeheader()
+        for record in records:
+            writer.writerow({
+                key: format_csv_value(value) for (key, value) in record.items()
+            })
+            number += 1
+    else:
+        for record in records:
+            output.write(json.dumps(record) + '\n')
+            number += 1
+    return number
+
+
+def format_csv_value(value) -> str | int | float:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, list):
+        return ', '.join(value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+
+def read_records(input_file: TextIO, input_format: str) -> Iterator[dict]:
+    if input_format == 'csv':
+        yield from csv.DictReader(input_file)
+    else:
+        for line in input_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def filtered_spell_ids(spell_db: SpellDataBase, args: argparse.Namespace
+        ) -> Iterator[int]:
+    '''Yields the IDs of the spells matching the filter arguments.'''
+    class_dict = None
+    if args.classes:
+        class_dict = {
+            class_name: class_name in args.classes 
+            for class_name in SpellInfo.classes
+        }
+    pager = spell_db.paginate_spells(
+        class_dict=class_dict, level=args.level, school=args.school, 
+        ritual=int(args.ritual), page_size=args.page_size
+    )
+    return (spell_id for (spell_id, _) in pager)
+
+
+def query_command(spell_db: SpellDataBase, args: argparse.Namespace) -> int:
+    summaries = spell_db.get_spell_summaries(
+        filtered_spell_ids(spell_db, args))
+    write_records(
+        map(summary_to_record, summaries), SUMMARY_FIELDS, args.format, 
+        args.output
+    )
+    return 0
+
+
+def export_command(spell_db: SpellDataBase, args: argparse.Namespace) -> int:
+    spells = spell_db.get_spells(filtered_spell_ids(spell_db, args))
+    number = write_records(
+        map(spell_to_record, spells), SPELL_FIELDS, args.format, args.output
+    )
+    print(f'Exported {number} spells', file=sys.stderr)
+    return 0
+
+
+def show_command(spell_db: SpellDataBase, args: argparse.Namespace) -> int:
+    spell_id = spell_db.get_spell_id(args.spell)
+    if spell_id is None and args.spell.isdigit():
+        spell_id = int(args.spell)
+    try:
+        spell = spell_db.get_spell(spell_id)
+    except (KeyError, StopIteration):
+        print(f'No spell named {args.spell!r}', file=sys.stderr)
+        return 1
+    if args.format == 'text':
+        args.output.write(str(spell) + '\n')
+    else:
+        write_records((spell_to_record(spell),), SPELL_FIELDS, args.format, 
+            args.output)
+    return 0
+
+
+def import_command(spell_db: SpellDataBase, args: argparse.Namespace) -> int:
+    input_format = args.format
+    if input_format is None:
+        input_format = 'csv' if args.input.name.endswith('.csv') else 'jsonl'
+    spells = map(record_to_spell, read_records(args.input, input_format))
+    spell_ids = spell_db.add_spells(spells, batch_size=args.batch_size)
+    print(f'Imported {len(spell_ids)} spells', file=sys.stderr)
+    return 0
+
+
+def add_filter_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--class', dest='classes', action='append', 
+        choices=SpellInfo.classes, metavar='CLASS',
+        help='only spells on the spell list of CLASS, can be repeated'
+    )
+    parser.add_argument(
+        '--level', type=int, default=-1, choices=range(len(SpellInfo.levels)),
+        metavar='LEVEL', help='only spells of LEVEL, 0 for cantrips'
+    )
+    parser.add_argument(
+        '--school', default='', choices=SpellInfo.schools, metavar='SCHOOL',
+        help='only spells of SCHOOL'
+    )
+    parser.add_argument(
+        '--ritual', action='store_true', help='only ritual spells'
+    )
+    parser.add_argument(
+        '--page-size', type=int, default=500, help=argparse.SUPPRESS
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='Query, import and export spell databases.'
+    )
+    parser.add_argument(
+        '--database', default=DEFAULT_DATABASE,
+        help=f'the spell database file (default: {DEFAULT_DATABASE})'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = subparsers.add_parser(
+        'query', help='list the spells matching the filters'
+    )
+    add_filter_arguments(query_parser)
+    query_parser.set_defaults(function=query_command)
+
+    export_parser = subparsers.add_parser(
+        'export', help='write every field of the spells matching the filters'
+    )
+    add_filter_arguments(export_parser)
+    export_parser.set_defaults(function=export_command)
+
+    for subparser in (query_parser, export_parser):
+        subparser.add_argument('--format', choices=FORMATS, default='jsonl')
+        subparser.add_argument(
+            '--output', type=argparse.FileType('w', encoding='utf-8'), 
+            default='-', help='output file (default: standard output)'
+        )
+
+    show_parser = subparsers.add_parser('show', help='show a single spell')
+    show_parser.add_argument('spell', help='the name or ID of the spell')
+    show_parser.add_argument(
+        '--format', choices=('text', *FORMATS), default='text'
+    )
+    show_parser.add_argument(
+        '--output', type=argparse.FileType('w', encoding='utf-8'), 
+        default='-', help=argparse.SUPPRESS
+    )
+    show_parser.set_defaults(function=show_command)
+
+    import_parser = subparsers.add_parser(
+        'import', 
+        help='add spells from a file written by export, creating the '
+            'database if it does not exist'
+    )
+    import_parser.add_argument(
+        'input', type=argparse.FileType('r', encoding='utf-8'),
+        help='JSON Lines or CSV file, - for standard input'
+    )
+    import_parser.add_argument(
+        '--format', choices=FORMATS, 
+        help='input format (default: from the file extension)'
+    )
+    import_parser.add_argument(
+        '--batch-size', type=int, default=500,
+        help='number of spells added per transaction'
+    )
+    import_parser.set_defaults(function=import_command)
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    schema_filename = ''
+    if not os.path.exists(args.database):
+        if args.command != 'import':
+            parser.error(f'database {args.database!r} does not exist')
+        schema_filename = SCHEMA_FILENAME
+    with SpellDataBase(args.database, schema_filename) as spell_db:
+        try:
+            return args.function(spell_db, args)
+        except BrokenPipeError:
+            # The reader of the output, such as head, stopped early. 
+            # Output still buffered is sent to devnull, so that flushing
+            # it at exit does not raise BrokenPipeError again.
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# spell-book - A GUI for managing spells in D&D 5e
+#    Copyright (C) 2023  briforsaur
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+Demonstrates concurrent reads from several processes during an import.
+
+A bulk import of synthetic spells runs in one process while several 
+reader processes repeatedly query the same database file, as happens
+when the app is open while a batch import runs. Each reader records how
+many reads it completed while the import was running and how long its
+slowest read took. The demo exits with status 1 if any reader had an 
+error or completed no reads, so it can be used as a check.
+
+In WAL mode (the default) readers are never blocked by the importer, 
+so their reads keep completing at a steady rate. Running the demo with
+--journal-mode delete shows the difference: every commit of the 
+importer locks the readers out until it finishes.
+
+Example usage:
+
+python spell_concurrency_demo.py --spells 50000 --readers 4
+python spell_concurrency_demo.py --journal-mode delete
+'''
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from spell_benchmark import synthetic_spells
+from spelldb import SpellDataBase, JOURNAL_MODES
+
+SCHEMA_FILENAME = os.path.join(os.path.dirname(__file__), 'spell_db_schema.sql')
+
+
+def import_spells(filename: str, journal_mode: str, number: int, 
+        batch_size: int, started, finished, results):
+    spell_db = SpellDataBase(filename, journal_mode=journal_mode)
+    spells = synthetic_spells(number, seed=1)
+    started.set()
+    start = time.perf_counter()
+    spell_db.add_spells(spells, batch_size=batch_size)
+    results.put(('importer', time.perf_counter() - start))
+    finished.set()
+    spell_db.close()
+
+
+def read_spells(reader: int, filename: str, journal_mode: str, started, 
+        finished, results):
+    # The caches are disabled so that every read goes to the database
+    spell_db = SpellDataBase(
+        filename, cache_size=0, query_cache_size=0, journal_mode=journal_mode
+    )
+    rng = random.Random(reader)
+    spell_ids = list(spell_db.get_spell_list().values())
+    started.wait()
+    latencies = []
+    errors = 0
+    while not finished.is_set():
+        start = time.perf_counter()
+        try:
+            spell_db.query_spells(level=rng.randrange(10))
+            spell_db.get_spell(rng.choice(spell_ids))
+        except sqlite3.OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    results.put(('reader', reader, latencies, errors))
+    spell_db.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--spells', type=int, default=20000, 
+        help='number of spells imported while the readers run'
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=500, 
+        help='number of spells imported per transaction'
+    )
+    parser.add_argument(
+        '--readers', type=int, default=3, help='number of reader processes'
+    )
+    parser.add_argument(
+        '--journal-mode', choices=JOURNAL_MODES, default='wal'
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'concurrency_demo.sqlite3')
+        spell_db = SpellDataBase(
+            filename, SCHEMA_FILENAME, journal_mode=args.journal_mode
+        )
+        # The readers need some spells to read before the import starts
+        spell_db.add_spells(synthetic_spells(1000))
+        spell_db.close()
+        started = multiprocessing.Event()
+        finished = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=read_spells, args=(
+                reader, filename, args.journal_mode, started, finished, 
+                results
+            ))
+            for reader in range(args.readers)
+        ]
+        processes.append(multiprocessing.Process(target=import_spells, args=(
+            filename, args.journal_mode, args.spells, args.batch_size, 
+            started, finished, results
+        )))
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    print(f'Journal mode: {args.journal_mode}')
+    failed_readers = 0
+    for report in sorted(reports):
+        if report[0] == 'importer':
+            print('Importer: {} spells in {:.2f} s'.format(
+                args.spells, report[1]))
+            continue
+        (_, reader, latencies, errors) = report
+        if not latencies:
+            print(f'Reader {reader}: no reads during the import')
+            failed_readers += 1
+            continue
+        latencies_ms = sorted(latency*1000 for latency in latencies)
+        print(
+            'Reader {}: {} reads during the import, median {:.1f} ms, '
+            'slowest {:.1f} ms, {} errors'.format(
+                reader, len(latencies_ms), 
+                statistics.median(latencies_ms), latencies_ms[-1], errors
+            )
+        )
+        if errors:
+            failed_readers += 1
+    if failed_readers:
+        print(f'{failed_readers} readers failed', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,15 @@
 BEGIN;
+DROP TABLE IF EXISTS spells_fts;
 DROP TABLE IF EXISTS spell_classes;
 DROP TABLE IF EXISTS spells;
 DROP TABLE IF EXISTS classes;
 DROP TABLE IF EXISTS schools;
 
 PRAGMA foreign_keys = ON;
+-- The tables created here are version 0 of the database, the scripts in
+-- the migrations directory are applied on top of them when the database
+-- is opened
+PRAGMA user_version = 0;
 
 CREATE TABLE classes (class_id INTEGER PRIMARY KEY, class_name TEXT);
 
@@ -35,7 +40,7 @@ CREATE TABLE spells (
 CREATE TABLE spell_classes (
     spell_id INTEGER,
     class_id INTEGER,
-    FOREIGN KEY (spell_id) REFERENCES spells(spell_id),
+    FOREIGN KEY (spell_id) REFERENCES spells(spell_id) ON DELETE CASCADE,
     FOREIGN KEY (class_id) REFERENCES classes(class_id)
 );
 
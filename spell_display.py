@@ -13,17 +13,23 @@
 #   
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-
-from select import select
+import time
+# Taken before any other import for the --startup-time report
+START_TIME = time.perf_counter()
+import queue
+import sys
 import tkinter as tk
 import tkinter.ttk as ttk
-from typing import Dict, List, Tuple
-from tkinter import StringVar, font as tkFont
+from dataclasses import dataclass
 
-from my_tk_extensions import ExtendedTextBox, TextEditor, add_tag_to_dict, create_tagrange, shift_tag_dict
+from lru_cache import LRUCache
+from my_tk_extensions import ExtendedTextBox, TextEditor, VirtualListbox
 from spell_info import SpellInfo
-from spelldb import SpellDataBase
-from filter_window import SpellFilterWindow
+from text_tags import TagSpans
+from spelldb import (
+    SpellDataBase, SpellPager, PagedSpellList, SpellNameIndex, SpellChange
+)
+from db_worker import DatabaseWorker
 
 
 class MainApplication(ttk.Frame):
@@ -65,40 +71,72 @@ class MainApplication(ttk.Frame):
         )
 
     def spell_selection(self):
-        spell_selected = self.spell_list_pane.get_list_selection()
-        if spell_selected:
-            spell_info = self.spell_list_pane.get_spell_info(spell_selected)
+        spell_id = self.spell_list_pane.get_selected_spell_id()
+        if spell_id is not None:
+            self.spell_list_pane.request_spell_info(
+                spell_id, self.show_spell_info
+            )
+
+    def show_spell_info(self, spell_info: SpellInfo):
+        # The spell may have been deleted before it could be loaded
+        if spell_info is not None:
             self.spell_info_pane.update_spell_info(spell_info)
 
 
 class SpellListPane(ttk.Frame):
+    # Milliseconds to wait after the last keystroke before searching
+    search_delay = 100
+    # Milliseconds to wait after the selection last changed before 
+    # showing the selected spell. This must be longer than the interval
+    # between repeated key presses while a key is held (typically 
+    # 30-50 ms). It is much shorter than the delay before a held key 
+    # starts repeating (250-600 ms), so the spell selected by the first
+    # key press is shown before the repeats begin
+    selection_delay = 60
+    # Number of spells loaded in advance above and below the selection
+    prefetch_radius = 5
+    prefetch_cache_size = 128
+
     def __init__(self, parent):
         ttk.Frame.__init__(self, parent, relief=tk.GROOVE, borderwidth=3)
         self.parent = parent
         self.spell_db = SpellDataBase('phb_5e_spells.sqlite3')
+        # All database calls made in response to the user run on the
+        # worker thread so that the window never waits on SQLite
+        self.db_worker = DatabaseWorker(self)
+        # Spells changed on the worker thread, waiting to be applied to
+        # the spell list by apply_spell_changes
+        self.spell_changes = queue.Queue()
+        self.spell_db.add_change_listener(self.spell_changes.put)
         self.filter = {'class_dict':{}, 'level':-1}
-        self.get_spell_list()
+        # Loaded on the worker thread so that the window can be shown
+        # before the spell list is read
+        self.spell_list = None
+        # Built the first time the user searches the current spell list
+        self.name_index = None
+        self.search_after_id = None
+        self.selection_after_id = None
+        # Spells near the selection, loaded so that they can be shown 
+        # without waiting for the database. Keyed by spell ID.
+        self.prefetched = LRUCache(self.prefetch_cache_size)
         self.configure_layout()
         self.add_widgets()
+        self.update_spell_listbox()
         
     def configure_layout(self):
         self.rowconfigure(1, weight=1) # Row 0 can resize
 
     def add_widgets(self):
-        # Converts Python list to the list type that tk uses
-        self.spell_namesvar = tk.StringVar(value=list(self.spell_list.keys()))
-        self.lstbx_spell_names = tk.Listbox(
-            self, listvariable=self.spell_namesvar
-        )
-        self.scrlbr_spell_names = ttk.Scrollbar(
-            self, orient=tk.VERTICAL, command=self.lstbx_spell_names.yview
+        # Only the visible spell names are read from the database, the
+        # rows of spell_list are (spell_id, spell_name) tuples
+        self.lstbx_spell_names = VirtualListbox(
+            self, self.spell_list, item_text=lambda row: row[1],
+            load_rows=self.load_list_rows
         )
-        # Connecting the listbox back to the scrollbar
-        self.lstbx_spell_names['yscrollcommand'] = self.scrlbr_spell_names.set 
-        # The SpellSelect event should be handled by the parent
+        # The SpellSelect event should be handled by the parent, it is 
+        # generated once the selection stops changing
         self.lstbx_spell_names.bind(
-            "<<ListboxSelect>>",
-            lambda e:self.event_generate('<<SpellSelect>>')
+            "<<ListboxSelect>>", lambda e:self.schedule_selection()
         )
         self.btn_new_spell = ttk.Button(
             self, text='New Spell...', command=self.new_spell_callback
@@ -112,12 +150,17 @@ class SpellListPane(ttk.Frame):
         self.btn_filter = ttk.Button(
             self, text='Filter...', command=self.filter_callback
         )
+        self.search_text = tk.StringVar()
+        self.ent_search = ttk.Entry(self, textvariable=self.search_text)
+        self.search_text.trace_add(
+            'write', lambda *args: self.schedule_search()
+        )
         # Placing the widgets on the grid
+        self.ent_search.grid(column=0, row=0, columnspan=3, sticky="ew")
         self.btn_filter.grid(column=3, row=0)
         self.lstbx_spell_names.grid(
-            column=0, row=1, columnspan=4, sticky="nsew"
+            column=0, row=1, columnspan=5, sticky="nsew"
         )
-        self.scrlbr_spell_names.grid(column=4, row=1, sticky="ns")
         self.btn_new_spell.grid(column=0, row=2)
         self.btn_edit_spell.grid(column=1, row=2)
         self.btn_del_spell.grid(column=2, row=2)
@@ -126,63 +169,342 @@ class SpellListPane(ttk.Frame):
         SpellEditWindow(self)
 
     def edit_spell_callback(self):
-        spell_selected = self.get_list_selection()
-        spell_info = self.get_spell_info(spell_selected)
-        spell_id = self.spell_list[spell_info.name]
-        SpellEditWindow(self, spell_info, spell_id)
+        spell_id = self.get_selected_spell_id()
+        if spell_id is not None:
+            self.db_worker.submit(
+                self.spell_db.get_spell, spell_id,
+                callback=lambda spell_info: SpellEditWindow(
+                    self, spell_info, spell_id)
+            )
 
     def del_spell_callback(self):
-        spell_selected = self.get_list_selection()
-        if spell_selected:
-            spell_id = self.spell_list[spell_selected]
-            self.spell_db.del_spell(spell_id)
-            self.update_spell_listbox()
+        spell_id = self.get_selected_spell_id()
+        if spell_id is not None:
+            self.db_worker.submit(
+                self.spell_db.del_spell, spell_id,
+                callback=lambda result: self.apply_spell_changes()
+            )
 
     def update_spell_listbox(self, select_spell: str=''):
-        self.get_spell_list()
-        self.spell_namesvar.set(list(self.spell_list.keys()))
+        # Only the latest spell list is displayed if the list is updated
+        # again before the query completes
+        self.db_worker.submit(
+            self.load_spell_list, dict(self.filter), select_spell, 
+            key='spell_list', callback=self.show_spell_list
+        )
+
+    def load_spell_list(self, spell_filter: dict, select_spell: str
+            ) -> tuple[PagedSpellList, int]:
+        # Runs on the worker thread
+        spell_list = PagedSpellList(
+            self.spell_db.paginate_spells(**spell_filter)
+        )
         if select_spell:
-            select_id = list(self.spell_list.keys()).index(select_spell)
+            # Seeks the name in the database's spell name index instead
+            # of searching the whole list
+            select_id = spell_list.find(select_spell)
         else:
             select_id = 0
-        self.lstbx_spell_names.select_set(select_id)
-        self.lstbx_spell_names.event_generate("<<ListboxSelect>>")
+        # Reading the length and the rows around the selection here so 
+        # that displaying the list does not have to wait for them
+        len(spell_list)
+        spell_list.rows(select_id, select_id + 1)
+        return (spell_list, select_id)
+
+    def show_spell_list(self, result: tuple[PagedSpellList, int]):
+        (self.spell_list, select_id) = result
+        # The name index and the prefetched spells are out of date once
+        # the spell list changes
+        self.name_index = None
+        self.prefetched.clear()
+        if self.search_text.get().strip():
+            self.apply_search()
+        else:
+            self.lstbx_spell_names.set_model(self.spell_list)
+            self.lstbx_spell_names.select(select_id)
+
+    def load_list_rows(self, start: int, stop: int):
+        # Rows missing from the displayed list are read on the worker 
+        # thread, and only the latest request matters while scrolling
+        model = self.lstbx_spell_names.model
+        self.db_worker.submit(
+            model.rows, start, stop, key='list_rows',
+            callback=lambda rows: self.show_list_rows(model)
+        )
+
+    def show_list_rows(self, model):
+        if model is self.lstbx_spell_names.model:
+            self.lstbx_spell_names.refresh()
+
+    def schedule_search(self):
+        # Waits for a pause in typing so that the list is not redrawn 
+        # for every keystroke
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(self.search_delay, self.apply_search)
+
+    def apply_search(self):
+        self.search_after_id = None
+        search_text = self.search_text.get().lstrip()
+        if self.spell_list is None:
+            # Searched again by show_spell_list once the list has loaded
+            return
+        if not search_text.strip():
+            self.lstbx_spell_names.set_model(self.spell_list)
+        elif self.name_index is None:
+            self.db_worker.submit(
+                self.load_name_index, self.spell_list, key='name_index',
+                callback=self.show_name_index
+            )
+        else:
+            self.lstbx_spell_names.set_model(
+                self.name_index.search(search_text)
+            )
+
+    def load_name_index(self, spell_list: PagedSpellList
+            ) -> tuple[PagedSpellList, SpellNameIndex]:
+        # Runs on the worker thread
+        generation = self.spell_db.write_generation
+        return (spell_list, SpellNameIndex(spell_list.pager, generation))
+
+    def show_name_index(self, result: tuple[PagedSpellList, SpellNameIndex]):
+        (spell_list, name_index) = result
+        # Discarding the index if the spell list changed while it loaded
+        if spell_list is self.spell_list:
+            self.name_index = name_index
+            self.apply_search()
+
+    def get_selected_spell_id(self) -> int:
+        selected_item = self.lstbx_spell_names.get_selected_item()
+        spell_id = None
+        if selected_item is not None:
+            spell_id = selected_item[0]
+        return spell_id
 
     def get_list_selection(self) -> str:
-        selected_items = self.lstbx_spell_names.curselection()
+        selected_item = self.lstbx_spell_names.get_selected_item()
         selected_spell = ''
-        if selected_items:
-            selected_spell = self.lstbx_spell_names.get(selected_items[0])
+        if selected_item is not None:
+            selected_spell = selected_item[1]
         return selected_spell
 
-    def get_spell_info(self, spell_name: str) -> SpellInfo:
-        spell_info = None
-        if spell_name in self.spell_list.keys():
-            spell_info = self.spell_db.get_spell(self.spell_list[spell_name])
-        return spell_info
+    def schedule_selection(self):
+        # Holding down an arrow key changes the selection many times a 
+        # second, so the spell is only shown once the selection settles
+        if self.selection_after_id is not None:
+            self.after_cancel(self.selection_after_id)
+        self.selection_after_id = self.after(
+            self.selection_delay, self.selection_settled
+        )
+        self.prefetch_spells()
+
+    def selection_settled(self):
+        self.selection_after_id = None
+        self.event_generate('<<SpellSelect>>')
+
+    def prefetch_spells(self):
+        '''
+        Loads the spells around the selection on the worker thread.
+
+        The spells are kept in memory so that whichever of them the 
+        selection settles on can be shown without waiting for the 
+        database. Only the latest prefetch is run if the selection moves
+        again before it starts.
+        '''
+        model = self.lstbx_spell_names.model
+        selected = self.lstbx_spell_names.selected
+        if model is None or selected is None:
+            return
+        # Only the rows already loaded, to avoid a query on this thread
+        rows = self.lstbx_spell_names.get_rows(
+            max(0, selected - self.prefetch_radius), 
+            selected + self.prefetch_radius + 1, load=False
+        )
+        spell_ids = [
+            row[0] for row in rows 
+            if row is not None and row[0] not in self.prefetched
+        ]
+        if spell_ids:
+            self.db_worker.submit(
+                self.load_spells, spell_ids, self.prefetched.generation, 
+                key='prefetch', callback=self.store_prefetched
+            )
+
+    def load_spells(self, spell_ids: list[int], generation: int
+            ) -> tuple[list[tuple[int, SpellInfo]], int]:
+        # Runs on the worker thread
+        try:
+            spells = list(zip(spell_ids, self.spell_db.get_spells(spell_ids)))
+        except KeyError:
+            # A spell was deleted, the list is about to be reloaded
+            spells = []
+        return (spells, generation)
+
+    def store_prefetched(
+            self, result: tuple[list[tuple[int, SpellInfo]], int]):
+        (spells, generation) = result
+        for (spell_id, spell_info) in spells:
+            self.prefetched.put(spell_id, spell_info, generation)
 
-    def get_spell_list(self):
-        self.spell_list = self.spell_db.query_spells(**self.filter)
+    def get_spell_info(self, spell_id: int) -> SpellInfo:
+        # Runs on the worker thread
+        try:
+            return self.spell_db.get_spell(spell_id)
+        except KeyError:
+            return None
+
+    def request_spell_info(self, spell_id: int, callback):
+        '''
+        Passes a spell to callback, loading it on the worker thread.
+
+        A prefetched spell is passed to callback straight away, and then
+        loaded again in case another program has changed it since. 
+        If another spell is requested before this one has loaded, only
+        the latest request is passed to its callback. callback is given
+        None if the spell no longer exists.
+        '''
+        spell_info = self.prefetched.get(spell_id)
+        if spell_info is not None:
+            callback(spell_info)
+        self.db_worker.submit(
+            self.get_spell_info, spell_id, key='spell_info', 
+            callback=callback
+        )
 
     def update_spell_db(self, spell_info: SpellInfo, spell_id: int):
+        self.db_worker.submit(
+            self.save_spell, spell_info, spell_id,
+            callback=lambda spell_name: self.apply_spell_changes()
+        )
+
+    def apply_spell_changes(self):
+        '''
+        Updates the spell list with the spells changed by the worker.
+
+        A spell that joins, leaves or is renamed in the current list is
+        inserted or removed in the rows already read, at the position 
+        found on the worker by counting the spells that sort before it, 
+        and the row now at that position is selected. The list is only 
+        read again in the unusual case of several spells in the list 
+        changing at once.
+        '''
+        changes: list[SpellChange] = []
+        while True:
+            try:
+                changes.extend(self.spell_changes.get_nowait())
+            except queue.Empty:
+                break
+        for change in changes:
+            self.prefetched.pop(change.spell_id)
+        if self.spell_list is None:
+            return
+        spell_list = self.spell_list
+        pager = spell_list.pager
+        listed_changes = [
+            change for change in changes
+            if (change.before is not None and pager.includes(change.before))
+            or (change.after is not None and pager.includes(change.after))
+        ]
+        if not listed_changes:
+            return
+        if len(listed_changes) > 1:
+            self.update_spell_listbox(self.get_list_selection())
+            return
+        change = listed_changes[0]
+        self.db_worker.submit(
+            self.find_change_positions, pager, change,
+            callback=lambda positions: self.show_spell_change(
+                spell_list, change, positions
+            )
+        )
+
+    def find_change_positions(
+            self, pager: SpellPager, change: SpellChange
+    ) -> tuple[int | None, int | None] | None:
+        '''
+        Returns the positions in pager's list at which change removes 
+        and inserts its spell, or None for either if the spell was not 
+        or is no longer listed.
+
+        Runs on the worker. Returns None if other spells have changed 
+        since, as the counts would then include their changes too.
+        '''
+        if not self.spell_changes.empty():
+            return None
+        old_position = new_position = None
+        is_listed = change.after is not None and pager.includes(change.after)
+        if change.before is not None and pager.includes(change.before):
+            old_position = pager.count_before(
+                change.before.name, change.spell_id)
+            if is_listed and (change.after.name, change.spell_id) < (
+                    change.before.name, change.spell_id):
+                # The renamed spell is counted at its new position
+                old_position -= 1
+        if is_listed:
+            new_position = pager.count_before(
+                change.after.name, change.spell_id)
+        return old_position, new_position
+
+    def show_spell_change(
+            self, spell_list: PagedSpellList, change: SpellChange,
+            positions: tuple[int | None, int | None] | None
+    ):
+        '''
+        Removes and inserts the row changed by change at the positions 
+        found by find_change_positions, if spell_list is still shown.
+        '''
+        if spell_list is not self.spell_list:
+            return
+        if positions is None:
+            self.update_spell_listbox(self.get_list_selection())
+            return
+        old_position, new_position = positions
+        if old_position is not None:
+            old_row = (change.spell_id, change.before.name)
+            spell_list.remove_row(old_position, change.generation)
+            if self.name_index is not None:
+                self.name_index.remove_row(old_row, change.generation)
+        if new_position is not None:
+            new_row = (change.spell_id, change.after.name)
+            spell_list.insert_row(new_position, new_row, change.generation)
+            if self.name_index is not None:
+                self.name_index.insert_row(new_row, change.generation)
+        if self.search_text.get().strip():
+            # The search results are a range of the name index, which 
+            # has to be searched again
+            self.apply_search()
+        else:
+            self.lstbx_spell_names.refresh()
+            self.lstbx_spell_names.select(
+                old_position if new_position is None else new_position
+            )
+
+    def save_spell(self, spell_info: SpellInfo, spell_id: int) -> str:
+        # Runs on the worker thread and returns the name the spell was
+        # saved with, which changes if another spell has the same name.
         # Can't have two spells with the same name
-        if spell_info.name in self.spell_list.keys():
+        existing_id = self.spell_db.get_spell_id(spell_info.name)
+        if existing_id is not None:
             # Checking to see if their IDs are the same (meaning a spell is
             # being updated)
-            if spell_id != self.spell_list[spell_info.name]:
+            if spell_id != existing_id:
                 i = 1
                 spell_info.name = spell_info.name + str(i)
-                while spell_info.name in self.spell_list.keys():
+                while self.spell_db.get_spell_id(spell_info.name) is not None:
                     i += 1
                     spell_info.name = spell_info.name[0:-1] + str(i)
         if spell_id is not None:
             self.spell_db.update_spell(spell_id, spell_info)
         else:
             self.spell_db.add_spell(spell_info)
-        self.update_spell_listbox(spell_info.name)
+        return spell_info.name
     
     def filter_callback(self):
-        self.filter_window = SpellFilterWindow(self)
+        # Imported on first use to keep it out of the startup time
+        from filter_window import SpellFilterWindow
+        self.filter_window = SpellFilterWindow(
+            self, self.spell_db, self.db_worker
+        )
         self.filter_window.bind('<<ApplyFilter>>', self.filter_event_handler)
 
     def filter_event_handler(self, event: tk.Event):
@@ -196,12 +518,18 @@ class SpellListPane(ttk.Frame):
 
 
 class SpellInfoPane(ttk.Frame):
+    # Number of rendered spells kept for showing them again quickly
+    render_cache_size = 64
+
     def __init__(self, parent):
         ttk.Frame.__init__(
             self, parent, relief=tk.GROOVE, borderwidth=3, 
             style='SpellInfo.TFrame'
         )
         self.parent = parent
+        self.render_cache = LRUCache(self.render_cache_size)
+        # The RenderedSpell currently shown, None before the first spell
+        self.rendered_spell = None
         self.configure_layout()
         self.add_widgets()
 
@@ -282,56 +610,108 @@ class SpellInfoPane(ttk.Frame):
         )
         self.scrlbr_description.pack(side='right', fill='y')
 
+    def get_rendered_spell(self, spell_info: SpellInfo) -> 'RenderedSpell':
+        '''
+        Returns the RenderedSpell for spell_info, from the cache if possible.
+
+        Spells are cached by name, and a cached RenderedSpell is only 
+        used if it was rendered from the same or an equal SpellInfo, so
+        an edited spell is always rendered again.
+        '''
+        rendered = self.render_cache.get(spell_info.name)
+        if (rendered is None or (rendered.spell_info is not spell_info
+                and rendered.spell_info != spell_info)):
+            rendered = RenderedSpell.from_spell_info(spell_info)
+            self.render_cache.put(spell_info.name, rendered)
+        return rendered
+
     def update_spell_info(self, spell_info: SpellInfo):
-        # Updating the labels
-        self.lbl_name['text'] = spell_info.name
-        self.lbl_ritual['text'] = 'Ritual' if spell_info.ritual else ''
-        self.lbl_classes['text'] = spell_info.get_classes_as_string()
-        self.lbl_level['text'] = spell_info.get_level_as_string()
-        self.lbl_school['text'] = spell_info.school
-        self.lbl_cast_time['text'] = ('Casting Time: ' 
-            + spell_info.get_cast_time_as_str())
-        self.lbl_range['text'] = 'Range: ' + spell_info.range
-        self.lbl_duration['text'] = 'Duration: ' + spell_info.duration
-        self.lbl_concentration['text'] = ('Concentration' 
-            if spell_info.concentration else '')
-        self.lbl_components['text'] = spell_info.get_vsm_components_as_string()
+        rendered = self.get_rendered_spell(spell_info)
+        shown = self.rendered_spell
+        if rendered is shown:
+            return
+        # Updating only the labels whose text has changed
+        for (label, text) in rendered.labels.items():
+            if shown is None or shown.labels[label] != text:
+                getattr(self, label)['text'] = text
         # Updating the text boxes
+        if (shown is None 
+                or shown.materials_text != rendered.materials_text
+                or shown.materials_tags != rendered.materials_tags):
+            self.txt_components.update_text_box(rendered.materials_text)
+            self.txt_components.apply_text_spans(rendered.materials_tags)
+        if (shown is None 
+                or shown.description_text != rendered.description_text
+                or shown.description_tags != rendered.description_tags):
+            self.txt_description.update_text_box(rendered.description_text)
+            self.txt_description.apply_text_spans(rendered.description_tags)
+        self.rendered_spell = rendered
+
+
+@dataclass
+class RenderedSpell:
+    '''
+    The text and tags shown by SpellInfoPane for a spell.
+
+    Building the strings for the labels and joining the description 
+    with the higher levels text is done once when the spell is first
+    shown, so that showing it again only has to pass the prepared text 
+    and tags to the widgets. labels maps the attribute names of the 
+    SpellInfoPane labels to their text, and the tags are relative to 
+    the start of their text boxes.
+    '''
+    spell_info: SpellInfo
+    labels: dict[str, str]
+    materials_text: str
+    materials_tags: TagSpans
+    description_text: str
+    description_tags: TagSpans
+
+    higher_levels_prefix = '\n\nAt Higher Levels. '
+
+    @classmethod
+    def from_spell_info(cls, spell_info: SpellInfo) -> 'RenderedSpell':
+        labels = {
+            'lbl_name': spell_info.name,
+            'lbl_ritual': 'Ritual' if spell_info.ritual else '',
+            'lbl_classes': spell_info.get_classes_as_string(),
+            'lbl_level': spell_info.get_level_as_string(),
+            'lbl_school': spell_info.school,
+            'lbl_cast_time': (
+                'Casting Time: ' + spell_info.get_cast_time_as_str()
+            ),
+            'lbl_range': 'Range: ' + spell_info.range,
+            'lbl_duration': 'Duration: ' + spell_info.duration,
+            'lbl_concentration': (
+                'Concentration' if spell_info.concentration else ''
+            ),
+            'lbl_components': spell_info.get_vsm_components_as_string(),
+        }
         materials_text = spell_info.materials
+        materials_tags = TagSpans()
         if materials_text:
             materials_text = '({})'.format(materials_text)
-        self.txt_components.update_text_box(materials_text)
-        # Shifting the materials text to account for the added parenthesis
-        materials_tags_shifted = shift_tag_dict(
-            spell_info.materials_tags, 0, 1
-        )
-        self.txt_components.apply_text_tags(materials_tags_shifted)
-        self.txt_description.update_text_box(spell_info.description)
-        self.txt_description['state'] = 'normal'
-        self.txt_description.apply_text_tags(spell_info.description_tags)
-        higher_levels_text = spell_info.higher_levels
-        if higher_levels_text:
-            higher_levels_prefix = '\n\nAt Higher Levels. '
-            higher_levels_text = higher_levels_prefix + higher_levels_text
-            higher_levels_line_offset = (
-                spell_info.description + higher_levels_prefix
-            ).count('\n')
-            higher_levels_char_offset = len(higher_levels_prefix.strip('\n'))
-            higher_levels_prefix_tags = create_tagrange(
-                higher_levels_line_offset + 1, 
-                end_char=higher_levels_char_offset
-            )
-            higher_levels_tags_shifted = shift_tag_dict(
-                spell_info.higher_levels_tags, higher_levels_line_offset, 
-                higher_levels_char_offset
+            # Shifting the tags to account for the added parenthesis
+            materials_tags = spell_info.materials_tags.shifted(1)
+        description_text = spell_info.description
+        description_tags = spell_info.description_tags.copy()
+        if spell_info.higher_levels:
+            higher_levels_start = len(description_text)
+            prefix = cls.higher_levels_prefix
+            # The prefix is in bold italics apart from the line breaks
+            description_tags.add(
+                'bolditalic', higher_levels_start + 2,
+                higher_levels_start + len(prefix)
             )
-            add_tag_to_dict(
-                higher_levels_tags_shifted, 'bolditalic', 
-                higher_levels_prefix_tags
+            description_tags.update(
+                spell_info.higher_levels_tags, 
+                higher_levels_start + len(prefix)
             )
-            self.txt_description.insert('end', higher_levels_text)
-            self.txt_description.apply_text_tags(higher_levels_tags_shifted)
-        self.txt_description['state'] = 'disabled'
+            description_text += prefix + spell_info.higher_levels
+        return cls(
+            spell_info, labels, materials_text, materials_tags, 
+            description_text, description_tags
+        )
 
 
 class SpellEditWindow(tk.Toplevel):
@@ -499,14 +879,14 @@ class NewSpellPane(ttk.Frame):
                 'M': self.chk_components_M_value.get()
             },
             materials=self.txt_materials.get(),
-            materials_tags=self.txt_materials.txt_editor.extract_text_tags(),
+            materials_tags=self.txt_materials.txt_editor.extract_text_spans(),
             description=self.txt_description.get(),
             description_tags=(
-                self.txt_description.txt_editor.extract_text_tags()
+                self.txt_description.txt_editor.extract_text_spans()
             ),
             higher_levels=self.txt_higher_levels.get(),
             higher_levels_tags=(
-                self.txt_higher_levels.txt_editor.extract_text_tags()
+                self.txt_higher_levels.txt_editor.extract_text_spans()
             ),
             in_class_spell_list={
                 'Bard': self.chk_bard_value.get(),
@@ -543,18 +923,18 @@ class NewSpellPane(ttk.Frame):
         self.chk_components_M_value.set(spell_info.components['M'])
         self.txt_materials.txt_editor.update_text_box(
             spell_info.materials, allow_editing=True)
-        self.txt_materials.txt_editor.apply_text_tags(
+        self.txt_materials.txt_editor.apply_text_spans(
             spell_info.materials_tags
         )
         self.txt_description.txt_editor.update_text_box(
             spell_info.description, allow_editing=True)
-        self.txt_description.txt_editor.apply_text_tags(
+        self.txt_description.txt_editor.apply_text_spans(
             spell_info.description_tags
         )
         self.txt_higher_levels.txt_editor.update_text_box(
             spell_info.higher_levels, allow_editing=True
         )
-        self.txt_higher_levels.txt_editor.apply_text_tags(
+        self.txt_higher_levels.txt_editor.apply_text_spans(
             spell_info.higher_levels_tags
         )
         self.chk_bard_value.set(spell_info.in_class_spell_list['Bard'])
@@ -567,9 +947,84 @@ class NewSpellPane(ttk.Frame):
         self.chk_wizard_value.set(spell_info.in_class_spell_list['Wizard'])
 
 
+def report_startup_time(root: tk.Tk, app: MainApplication):
+    '''
+    Prints the times to the first paint and to a loaded spell list.
+
+    The times are measured from the start of this module, before any 
+    other imports, then the application is closed.
+    '''
+    root.wait_visibility()
+    root.update_idletasks()
+    print('first paint: {:.1f} ms'.format(
+        (time.perf_counter() - START_TIME)*1000))
+    def wait_for_spell_list():
+        if app.spell_list_pane.spell_list is None:
+            root.after(1, wait_for_spell_list)
+            return
+        print('spell list loaded: {:.1f} ms'.format(
+            (time.perf_counter() - START_TIME)*1000))
+        root.destroy()
+    wait_for_spell_list()
+
+
+def measure_startup(number_of_imports: int = 15):
+    '''
+    Runs the application in a new process and prints its startup time.
+
+    The new process is run with python -X importtime, and the imports
+    that took the longest, including the imports they made, are listed
+    along with the time of each import alone, then the times to the 
+    first paint and to a loaded spell list.
+    '''
+    # Only needed here, so kept out of the startup time being measured
+    import re
+    import subprocess
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', __file__, '--startup-report'],
+        capture_output=True, text=True
+    )
+    total_time = (time.perf_counter() - start)*1000
+    imports = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (.*)', line)
+        if match is not None:
+            imports.append(
+                (int(match[2])/1000, int(match[1])/1000, match[3].rstrip())
+            )
+        elif not line.startswith('import time:'):
+            print(line, file=sys.stderr)
+    imports.sort(reverse=True)
+    print(f'{"cumulative":>10} {"self":>8}  import (ms)')
+    for (cumulative, self_time, name) in imports[:number_of_imports]:
+        print(f'{cumulative:10.1f} {self_time:8.1f}  {name}')
+    print(result.stdout, end='')
+    print('process total: {:.1f} ms'.format(total_time))
+
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='A D&D 5e spell book.')
+    parser.add_argument(
+        '--startup-time', action='store_true',
+        help='measure the import times and the time until the window is '
+            'shown, then exit'
+    )
+    parser.add_argument(
+        '--startup-report', action='store_true', help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+    if args.startup_time:
+        measure_startup()
+        sys.exit()
     root = tk.Tk()
     root.title("SpellBook")
     root.minsize(width=700, height=75)
-    MainApplication(root).pack(side="top", fill="both", expand=True)
+    app = MainApplication(root)
+    app.pack(side="top", fill="both", expand=True)
+    if args.startup_report:
+        root.after_idle(report_startup_time, root, app)
     root.mainloop()
\ No newline at end of file
@@ -13,9 +13,42 @@
 #   
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+from collections.abc import Iterator, Mapping
 from dataclasses import dataclass
 from itertools import compress
-from my_tk_extensions import TagDict
+from text_tags import TagDict, TagSpans
+
+class LazyTags:
+    '''
+    A SpellInfo field holding TagSpans that are decoded on first access.
+
+    The field can be set to TagSpans or to tags in any format accepted
+    by TagSpans.decode: a TagDict of Tk indices into the text of the
+    field named text_field, offset lists, or either one encoded as a 
+    JSON string, as stored in the database. Other formats are only 
+    converted the first time the field is read, so spells whose tags 
+    are never displayed do not pay for decoding them.
+    '''
+    def __init__(self, text_field: str):
+        self.text_field = text_field
+
+    def __set_name__(self, owner, name: str):
+        self.attribute_name = '_' + name
+
+    def __get__(self, instance, owner=None) -> TagSpans:
+        if instance is None:
+            # Tells dataclass that the field has no default value
+            raise AttributeError(self.attribute_name[1:])
+        value = getattr(instance, self.attribute_name)
+        if not isinstance(value, TagSpans):
+            value = TagSpans.decode(value, getattr(instance, self.text_field))
+            setattr(instance, self.attribute_name, value)
+        return value
+
+    def __set__(self, instance, value: TagSpans | TagDict | str):
+        setattr(instance, self.attribute_name, value)
+
 
 @dataclass
 class SpellInfo:
@@ -29,11 +62,11 @@ class SpellInfo:
     duration: str
     components: dict[str, bool]
     materials: str
-    materials_tags: TagDict
+    materials_tags: TagSpans = LazyTags('materials')
     description: str
-    description_tags: TagDict
+    description_tags: TagSpans = LazyTags('description')
     higher_levels: str
-    higher_levels_tags: TagDict
+    higher_levels_tags: TagSpans = LazyTags('higher_levels')
     in_class_spell_list: dict[str, bool]
     #
     levels = (
@@ -208,6 +241,256 @@ class SpellInfo:
         )
         return spell_info_str
 
+    def compact(self) -> 'CompactSpellInfo':
+        '''Returns a memory-efficient, read-only copy of this spell.'''
+        return CompactSpellInfo.from_spell_info(self)
+
+
+@dataclass
+class SpellSummary:
+    '''
+    The header fields of a spell, without its text or tags.
+
+    SpellSummary is used for listing, sorting and counting spells 
+    without reading their descriptions from the database. It has the
+    same fields as SpellInfo apart from the text and tag fields, and
+    the same methods for formatting them.
+    '''
+    __slots__ = (
+        'spell_id', 'name', 'level', 'school', 'ritual', 'cast_time', 
+        'range', 'concentration', 'duration', 'components', 
+        'in_class_spell_list'
+    )
+    spell_id: int
+    name: str
+    level: int
+    school: str
+    ritual: bool
+    cast_time: float
+    range: str
+    concentration: bool
+    duration: str
+    components: dict[str, bool]
+    in_class_spell_list: dict[str, bool]
+
+    levels = SpellInfo.levels
+    schools = SpellInfo.schools
+    cast_time_units = SpellInfo.cast_time_units
+    cast_time_values = SpellInfo.cast_time_values
+    range_units = SpellInfo.range_units
+    classes = SpellInfo.classes
+
+    get_cast_time_as_quantity_and_unit = (
+        SpellInfo.get_cast_time_as_quantity_and_unit)
+    get_cast_time_as_str = SpellInfo.get_cast_time_as_str
+    get_level_as_string = SpellInfo.get_level_as_string
+    get_range_as_quantity_and_unit = SpellInfo.get_range_as_quantity_and_unit
+    get_vsm_components_as_string = SpellInfo.get_vsm_components_as_string
+    get_classes_as_list = SpellInfo.get_classes_as_list
+    get_classes_as_string = SpellInfo.get_classes_as_string
+    get_school_as_number = SpellInfo.get_school_as_number
+
+    @classmethod
+    def from_spell_info(cls, spell_id: int, spell_info: SpellInfo
+            ) -> 'SpellSummary':
+        '''Creates the summary of a spell that has not been read back.'''
+        return cls(
+            spell_id=spell_id,
+            name=spell_info.name,
+            level=spell_info.level,
+            school=spell_info.school,
+            ritual=spell_info.ritual,
+            cast_time=spell_info.cast_time,
+            range=spell_info.range,
+            concentration=spell_info.concentration,
+            duration=spell_info.duration,
+            components=dict(spell_info.components),
+            in_class_spell_list=dict(spell_info.in_class_spell_list)
+        )
+
+
+class FlagView(Mapping):
+    '''
+    A read-only dictionary view of the bits of an integer bitmask.
+
+    Bit i of mask is the value of the key names[i], so that 
+    FlagView(('V', 'S', 'M'), 0b101) behaves like 
+    {'V': True, 'S': False, 'M': True}.
+    '''
+    __slots__ = ('names', 'mask')
+
+    def __init__(self, names: tuple[str, ...], mask: int):
+        self.names = names
+        self.mask = mask
+
+    def __getitem__(self, key: str) -> bool:
+        try:
+            bit = self.names.index(key)
+        except ValueError:
+            raise KeyError(key) from None
+        return bool(self.mask >> bit & 1)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def flags_to_mask(names: tuple[str, ...], flags: Mapping[str, bool]) -> int:
+    '''Converts a dictionary of flags to a bitmask, see FlagView.'''
+    return sum(1 << bit for (bit, name) in enumerate(names) if flags.get(name))
+
+
+class CompactSpellInfo:
+    '''
+    A memory-efficient, read-only representation of a spell.
+
+    CompactSpellInfo holds the same information as SpellInfo, for 
+    keeping large collections of spells in memory:
+
+    The VSM components and the class spell lists are stored as integer
+    bitmasks (component_mask and class_mask) rather than dictionaries.
+    They are still available as the components and in_class_spell_list
+    read-only mappings, so components['V'] works as with SpellInfo.
+
+    The school, range and duration strings are interned, so spells 
+    with the same values share a single string.
+
+    The tags are kept as TagSpans, which store integer character 
+    offsets in arrays, and are shared with the SpellInfo the 
+    CompactSpellInfo was made from.
+
+    All of the SpellInfo methods for reading spells, such as 
+    get_classes_as_list and get_vsm_components_as_string, are 
+    available. Use expand() to get an editable SpellInfo.
+    '''
+    __slots__ = (
+        'name', 'level', 'school', 'ritual', 'cast_time', 'range', 
+        'concentration', 'duration', 'component_mask', 'materials', 
+        'materials_tags', 'description', 'description_tags',
+        'higher_levels', 'higher_levels_tags', 'class_mask'
+    )
+    component_names = ('V', 'S', 'M')
+    levels = SpellInfo.levels
+    schools = SpellInfo.schools
+    cast_time_units = SpellInfo.cast_time_units
+    cast_time_values = SpellInfo.cast_time_values
+    range_units = SpellInfo.range_units
+    classes = SpellInfo.classes
+
+    def __init__(self, name: str, level: int, school: str, ritual: bool,
+            cast_time: float, range: str, concentration: bool, 
+            duration: str, component_mask: int, materials: str,
+            materials_tags: TagSpans, description: str, 
+            description_tags: TagSpans, higher_levels: str,
+            higher_levels_tags: TagSpans, class_mask: int):
+        self.name = name
+        self.level = level
+        self.school = sys.intern(school)
+        self.ritual = bool(ritual)
+        self.cast_time = cast_time
+        self.range = sys.intern(range)
+        self.concentration = bool(concentration)
+        self.duration = sys.intern(duration)
+        self.component_mask = component_mask
+        self.materials = materials
+        self.materials_tags = materials_tags
+        self.description = description
+        self.description_tags = description_tags
+        self.higher_levels = higher_levels
+        self.higher_levels_tags = higher_levels_tags
+        self.class_mask = class_mask
+
+    @classmethod
+    def from_spell_info(cls, spell_info: SpellInfo) -> 'CompactSpellInfo':
+        return cls(
+            name=spell_info.name,
+            level=spell_info.level,
+            school=spell_info.school,
+            ritual=spell_info.ritual,
+            cast_time=spell_info.cast_time,
+            range=spell_info.range,
+            concentration=spell_info.concentration,
+            duration=spell_info.duration,
+            component_mask=flags_to_mask(
+                cls.component_names, spell_info.components),
+            materials=spell_info.materials,
+            materials_tags=spell_info.materials_tags,
+            description=spell_info.description,
+            description_tags=spell_info.description_tags,
+            higher_levels=spell_info.higher_levels,
+            higher_levels_tags=spell_info.higher_levels_tags,
+            class_mask=flags_to_mask(
+                cls.classes, spell_info.in_class_spell_list),
+        )
+
+    def expand(self) -> SpellInfo:
+        '''Returns an editable SpellInfo copy of this spell.'''
+        return SpellInfo(
+            name=self.name,
+            level=self.level,
+            school=self.school,
+            ritual=self.ritual,
+            cast_time=self.cast_time,
+            range=self.range,
+            concentration=self.concentration,
+            duration=self.duration,
+            components=dict(self.components),
+            materials=self.materials,
+            materials_tags=self.materials_tags.copy(),
+            description=self.description,
+            description_tags=self.description_tags.copy(),
+            higher_levels=self.higher_levels,
+            higher_levels_tags=self.higher_levels_tags.copy(),
+            in_class_spell_list=dict(self.in_class_spell_list),
+        )
+
+    @property
+    def components(self) -> FlagView:
+        return FlagView(self.component_names, self.component_mask)
+
+    @property
+    def in_class_spell_list(self) -> FlagView:
+        return FlagView(self.classes, self.class_mask)
+
+    def get_vsm_components_as_string(self) -> str:
+        return ''.join(
+            name for (bit, name) in enumerate(self.component_names) 
+            if self.component_mask >> bit & 1
+        )
+
+    def get_classes_as_list(self) -> list[str]:
+        return [
+            name for (bit, name) in enumerate(self.classes) 
+            if self.class_mask >> bit & 1
+        ]
+
+    get_cast_time_as_quantity_and_unit = (
+        SpellInfo.get_cast_time_as_quantity_and_unit)
+    get_cast_time_as_str = SpellInfo.get_cast_time_as_str
+    get_level_as_string = SpellInfo.get_level_as_string
+    get_range_as_quantity_and_unit = SpellInfo.get_range_as_quantity_and_unit
+    get_classes_as_string = SpellInfo.get_classes_as_string
+    get_school_as_number = SpellInfo.get_school_as_number
+    __str__ = SpellInfo.__str__
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactSpellInfo):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) 
+            for name in self.__slots__
+        )
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(name={self.name!r}, level={self.level})'
+
 
 example_spell = SpellInfo(
     name= 'Armor of Agathys',
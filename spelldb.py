@@ -13,10 +13,87 @@
 #   
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
-from spell_info import SpellInfo, example_spell
-import json
+from spell_info import SpellInfo, SpellSummary, example_spell
+from lru_cache import LRUCache
+import os
+import re
 import sqlite3
-from itertools import compress, chain
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from itertools import compress, chain, count, islice
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from db_stats import DatabaseStats
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+SYNCHRONOUS_LEVELS = ('off', 'normal', 'full', 'extra')
+
+def split_sql_script(script: str) -> list[str]:
+    '''
+    Splits an SQL script into its statements.
+
+    Unlike executescript, the statements can then be executed one at a
+    time inside a transaction. Semicolons in comments, strings and 
+    trigger bodies do not end a statement. A ValueError is raised if 
+    anything other than comments follows the last complete statement, 
+    such as a final statement missing its semicolon, rather than 
+    silently leaving it out.
+    '''
+    statements = []
+    start = 0
+    end = script.find(';')
+    while end >= 0:
+        if sqlite3.complete_statement(script[start:end + 1]):
+            statements.append(script[start:end + 1].strip())
+            start = end + 1
+        end = script.find(';', end + 1)
+    remainder = re.sub(r'--[^\n]*|/\*.*?(\*/|$)', '', script[start:], 
+        flags=re.DOTALL)
+    if remainder.strip():
+        raise ValueError(
+            f'Incomplete SQL statement at the end of the script: '
+            f'{script[start:].strip()!r}'
+        )
+    return statements
+
+
+@dataclass(frozen=True)
+class SpellChange:
+    '''
+    A change to one spell, as reported to SpellDataBase change listeners.
+
+    kind is 'inserted', 'updated' or 'deleted' and name is the name of 
+    the spell after the change, or its last name if it was deleted. 
+    before and after are summaries of the spell before and after the 
+    change, with None for a spell that did not exist, so that a 
+    listener showing a filtered list of spells can tell whether the 
+    spell has been renamed, or has joined or left the list. generation
+    is the write_generation of the database once the change committed.
+    '''
+    spell_id: int
+    before: SpellSummary
+    after: SpellSummary
+    generation: int
+
+    @property
+    def kind(self) -> str:
+        if self.before is None:
+            return 'inserted'
+        if self.after is None:
+            return 'deleted'
+        return 'updated'
+
+    @property
+    def name(self) -> str:
+        return (self.after or self.before).name
+
 
 class SpellDataBase:
     '''
@@ -50,28 +127,133 @@ class SpellDataBase:
         The spell_school column is a foreign key column that references 
         the school_id from the schools table.
 
-        All of the *_tags columns are stored as strings using Python's
-        json dumps.
+        All of the *_tags columns are stored as JSON objects of 
+        character offsets, written by TagSpans.to_json. Spells saved 
+        by older versions store TagDicts of Tk indices instead; these 
+        are converted when the spell is read and saved in the new 
+        format the next time the spell is updated.
 
     spell_classes - An intersection table to link spells to classes.
         The table has two columns: spell_id, which is a foreign key 
         referencing the spell_id of the spells table, and class_id, 
         referencing the class_id of the classes table. This table allows
         a many-to-many relationship between the spells and the classes.
+
+    The schema describes version 0 of the database. Later changes, such
+    as indexes, are applied by the migration scripts in MIGRATIONS_DIR
+    every time a SpellDataBase is opened; see migrate_database().
+
+    Connections to the database are long-lived: each thread that uses a
+    SpellDataBase gets its own connection the first time it needs one,
+    and that connection is reused by every subsequent method call from
+    that thread. The connections are released with close(), or 
+    automatically when the SpellDataBase is used as a context manager:
+
+    with SpellDataBase('spells.sqlite3') as spell_db:
+        spell_list = spell_db.get_spell_list()
+
+    Several processes can use the same database file at once. By 
+    default the database uses SQLite's write-ahead log (journal_mode 
+    'wal'), in which readers do not block the writer and the writer 
+    does not block readers, with synchronous 'normal', which is safe 
+    from corruption in WAL mode and only risks losing the most recent
+    commits on a power failure. Any other SQLite journal mode and 
+    synchronous level can be chosen, or None to keep the database's 
+    current settings. A connection waits up to busy_timeout seconds 
+    for another connection's lock before failing; see transaction() 
+    for how writes are retried.
+
+    Every method that modifies the database does so in a single 
+    transaction, so a spell and its class relations are always written
+    or removed together. Several edits can be grouped under one commit
+    with the transaction() context manager:
+
+    with spell_db.transaction():
+        spell_db.del_spell(old_id)
+        spell_db.add_spell(new_spell)
+
+    Spells read with get_spell are kept in a least recently used cache
+    of up to cache_size spells (0 disables the cache). The methods that
+    modify spells remove the affected spells from the cache when their
+    transaction commits, and the whole cache is cleared whenever the 
+    database is modified by another connection or process.
+
+    The results of query_spells and the spell counts of paginate_spells
+    are kept in a second cache of up to query_cache_size results, keyed
+    on the normalized filters (see normalize_filters). Every cached 
+    result is tagged with write_generation, a counter that is advanced
+    whenever a transaction ends or another connection or process 
+    changes the database, so a result is only reused if nothing could
+    have changed it since it was read.
+
+    Performance statistics can be collected for a block of code with 
+    the instrument() context manager, or until further notice with 
+    enable_instrumentation(), and read with stats():
+
+    with spell_db.instrument(slow_query_ms=50):
+        spell_db.query_spells(level=3)
+        print(spell_db.stats())
+
+    Programs that show spells can be told about the spells added, 
+    updated and deleted through a SpellDataBase by registering a change
+    listener with add_change_listener(). The listener is called with a
+    list of SpellChange objects once each transaction commits, on the 
+    thread that made the changes. Changes made by other SpellDataBase 
+    objects or processes are not reported.
+
+    Instrumentation is off by default and costs nothing while off.
     '''
-    def __init__(self, name: str, schema_filename = ''):
+    # The methods whose calls are recorded when instrumentation is on
+    instrumented_methods = (
+        'add_spell', 'add_spells', 'get_spell', 'get_spells', 
+        'fetch_spell_batch', 'get_spell_summaries', 'get_spell_id', 'get_spell_list', 
+        'update_spell', 'del_spell', 'query_spells', 'search_spells',
+        'facet_counts', 'run_query',
+    )
+    # The number of spells read per query by get_spells. This also keeps
+    # the number of query parameters well below SQLite's limit.
+    get_spells_batch_size = 500
+    # The number of times a transaction retries acquiring the write lock
+    # after busy_timeout expires, and the delay before the first retry
+    # in seconds, which doubles with every retry
+    write_retries = 5
+    write_retry_delay = 0.05
+
+    def __init__(self, name: str, schema_filename = '', cache_size = 128,
+            query_cache_size = 32, journal_mode: str = 'wal', 
+            synchronous: str = 'normal', busy_timeout: float = 5.0):
+        if journal_mode is not None and journal_mode not in JOURNAL_MODES:
+            raise ValueError(f'Unknown journal mode {journal_mode!r}')
+        if synchronous is not None and synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f'Unknown synchronous level {synchronous!r}')
         self.name = name
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.spell_cache = LRUCache(cache_size)
+        self.query_cache = LRUCache(query_cache_size)
+        self._write_counter = count()
+        self.write_generation = next(self._write_counter)
+        self.instrumentation: 'DatabaseStats' = None
+        self.change_listeners: list[Callable[[list[SpellChange]], None]] = []
         if schema_filename:
             self.initialize_database(schema_filename)
-        self.class_ids = self.get_ids('classes')
-        self.school_ids = self.get_ids('schools')
+        self.migrate_database()
+        (self.class_ids, self.school_ids) = self.get_lookup_ids()
+        # Reverse mappings for converting IDs in the database to names
+        self.class_names = {v: k for (k, v) in self.class_ids.items()}
+        self.school_names = {v: k for (k, v) in self.school_ids.items()}
 
     def open_connection(self) -> sqlite3.Connection:
         '''
         Connects to the database with some configuration options set.
 
-        This method enables foreign keys before returning a new sqlite3
-        Connection object.
+        This method sets the busy timeout, journal mode and synchronous
+        level chosen when the SpellDataBase was created and enables 
+        foreign keys before returning a new sqlite3 Connection object.
         
         The spell database uses foreign keys to enforce matching ID's 
         between the tables, specifically where tables use the class ID,
@@ -79,10 +261,328 @@ class SpellDataBase:
         foreign keys must be enabled with every new connection to the 
         database.
         '''
-        connection = sqlite3.connect(self.name)
+        connection = sqlite3.connect(
+            self.name, timeout=self.busy_timeout, check_same_thread=False
+        )
+        if self.journal_mode is not None:
+            self.set_journal_mode(connection, self.journal_mode)
+        if self.synchronous is not None:
+            connection.execute(f'PRAGMA synchronous = {self.synchronous}')
         connection.execute('PRAGMA foreign_keys = ON')
+        if self.instrumentation is not None:
+            self.instrumentation.count('connections_opened')
+        return connection
+
+    def set_journal_mode(self, connection: sqlite3.Connection, 
+            journal_mode: str):
+        '''
+        Switches the database to a journal mode if it isn't already.
+
+        The journal mode is stored in the database file and shared by 
+        every connection to it. Switching to or from WAL mode needs 
+        exclusive access, so if another connection is using the 
+        database the mode is left unchanged; the connection still works
+        in the current mode, and a later connection can switch it.
+        '''
+        current_mode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+        if current_mode == journal_mode:
+            return
+        try:
+            connection.execute(f'PRAGMA journal_mode = {journal_mode}')
+        except sqlite3.OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+
+    def get_connection(self) -> sqlite3.Connection:
+        '''
+        Returns the calling thread's connection to the database.
+
+        The connection is opened with open_connection() the first time
+        a thread asks for it and is then kept open until close() is 
+        called, so the cost of connecting and configuring the 
+        connection is only paid once per thread.
+
+        sqlite3 connections should not be shared between threads, so 
+        each thread is given its own connection. The connections are 
+        created with check_same_thread disabled only so that close() 
+        can release all of them from whichever thread calls it.
+        '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.open_connection()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
         return connection
 
+    def close(self):
+        '''
+        Closes every connection opened by this SpellDataBase.
+
+        Any uncommitted changes are discarded. The SpellDataBase can 
+        still be used after closing; new connections are opened as 
+        needed.
+        '''
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Groups database modifications into a single transaction.
+
+        Yields a cursor on the calling thread's connection. The 
+        transaction is committed when the outermost transaction() block
+        exits normally and rolled back if it exits with an exception.
+        The outermost block begins the transaction immediately, taking
+        the database's write lock up front so that reads made inside
+        the block (such as looking up the next free spell_id) cannot be
+        invalidated by another connection before the writes happen.
+
+        Transactions can be nested: an inner transaction() block joins
+        the transaction of the enclosing block rather than committing 
+        on its own, which allows methods such as add_spell to be 
+        combined into larger atomic operations by the caller.
+
+        If another connection holds the write lock for longer than 
+        busy_timeout, beginning the transaction is retried up to 
+        write_retries times, waiting write_retry_delay seconds before 
+        the first retry and twice as long before each following one.
+        '''
+        connection = self.get_connection()
+        depth = getattr(self._local, 'transaction_depth', 0)
+        committed_changes = None
+        if depth == 0:
+            self._local.invalidated_spells = set()
+            self._local.changes = []
+            if not connection.in_transaction:
+                self.begin_immediate(connection)
+        self._local.transaction_depth = depth + 1
+        try:
+            yield connection.cursor()
+        except BaseException:
+            if depth == 0:
+                connection.rollback()
+                if self.instrumentation is not None:
+                    self.instrumentation.count('rollbacks')
+                # Spells read inside the transaction may have been cached
+                # with changes that no longer exist
+                self.spell_cache.clear()
+                self.advance_write_generation()
+            raise
+        else:
+            if depth == 0:
+                connection.commit()
+                if self.instrumentation is not None:
+                    self.instrumentation.count('commits')
+                self.spell_cache.pop_many(self._local.invalidated_spells)
+                self.advance_write_generation()
+                committed_changes = self._local.changes
+        finally:
+            self._local.transaction_depth = depth
+        # Listeners are called outside of the transaction so that they 
+        # can use the database themselves
+        if committed_changes:
+            self.notify_changes(committed_changes)
+
+    def begin_immediate(self, connection: sqlite3.Connection):
+        '''Takes the write lock, retrying with backoff while it is busy.'''
+        delay = self.write_retry_delay
+        for retry in range(self.write_retries + 1):
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as error:
+                if 'locked' not in str(error) or retry == self.write_retries:
+                    raise
+            if self.instrumentation is not None:
+                self.instrumentation.count('write_retries')
+            time.sleep(delay)
+            delay *= 2
+
+    def invalidate_spells(self, spell_ids: Iterable[int]):
+        '''
+        Marks spells as modified by the current transaction.
+
+        The spells are removed from the spell cache when the transaction
+        commits. Must be called inside a transaction() block.
+        '''
+        self._local.invalidated_spells.update(spell_ids)
+
+    def advance_write_generation(self):
+        '''Marks every result in the query cache as out of date.'''
+        self.write_generation = next(self._write_counter)
+
+    def check_data_version(self, connection: sqlite3.Connection):
+        '''
+        Clears the spell cache if another connection changed the database.
+
+        SQLite's data_version pragma changes whenever a connection other
+        than the one running the pragma commits a change to the 
+        database, including connections in other processes. The value
+        is only meaningful for comparison on the same connection, so the
+        last value is kept for each thread's connection. A thread's 
+        first check always clears the cache because there is nothing to
+        compare to.
+        '''
+        data_version = connection.execute(
+            'PRAGMA data_version').fetchone()[0]
+        if getattr(self._local, 'data_version', None) != data_version:
+            self.spell_cache.clear()
+            self.advance_write_generation()
+            self._local.data_version = data_version
+
+    def add_change_listener(
+            self, listener: Callable[[list[SpellChange]], None]):
+        '''
+        Calls listener with the spells changed by each transaction.
+
+        See the class documentation for details.
+        '''
+        self.change_listeners.append(listener)
+
+    def remove_change_listener(
+            self, listener: Callable[[list[SpellChange]], None]):
+        '''Stops calling a listener added with add_change_listener.'''
+        self.change_listeners.remove(listener)
+
+    def get_change_summary(self, spell_id: int) -> SpellSummary:
+        '''
+        Reads the summary of a spell that is about to be changed.
+
+        Returns None if the spell does not exist or if there are no 
+        change listeners, so that changes are only tracked when they 
+        will be reported. Must be called inside a transaction() block.
+        '''
+        if not self.change_listeners:
+            return None
+        return self.fetch_summary_batch([spell_id]).get(spell_id)
+
+    def record_change(self, spell_id: int, before: SpellSummary, 
+            spell_info: SpellInfo = None):
+        '''
+        Records a change to be reported when the transaction commits.
+
+        before is the summary from get_change_summary, or None for a new
+        spell, and spell_info is the spell as written, or None for a 
+        deleted spell. Must be called inside a transaction() block.
+        '''
+        if not self.change_listeners:
+            return
+        after = None
+        if spell_info is not None:
+            after = SpellSummary.from_spell_info(spell_id, spell_info)
+        self._local.changes.append((spell_id, before, after))
+
+    def notify_changes(self, changes: list[tuple]):
+        generation = self.write_generation
+        spell_changes = [
+            SpellChange(spell_id, before, after, generation) 
+            for (spell_id, before, after) in changes
+        ]
+        for listener in list(self.change_listeners):
+            listener(spell_changes)
+
+    def enable_instrumentation(self, slow_query_ms: float = None
+            ) -> 'DatabaseStats':
+        '''
+        Starts recording performance statistics, returning the recorder.
+
+        Every method in instrumented_methods is replaced on this 
+        instance by a wrapper that records its number of calls, a 
+        histogram of its latency and the number of rows it returned. 
+        The connections opened and the transactions committed or rolled
+        back are also counted.
+
+        If slow_query_ms is given, the SQL text, parameters and query 
+        plan of every query run with run_query (which includes the 
+        queries of query_spells, search_spells and SpellPager) that 
+        takes at least slow_query_ms milliseconds are logged.
+
+        Any statistics recorded previously are discarded.
+        '''
+        # Imported on first use, as instrumentation is rarely enabled
+        from db_stats import DatabaseStats
+
+        stats = DatabaseStats(slow_query_ms)
+        self.install_instrumentation(stats)
+        return stats
+
+    def install_instrumentation(self, stats: 'DatabaseStats'):
+        '''Wraps the instrumented methods to record calls in stats.'''
+        self.disable_instrumentation()
+        for method_name in self.instrumented_methods:
+            method = getattr(self, method_name)
+            if method_name == 'run_query':
+                wrapper = self.wrap_run_query(stats, method)
+            else:
+                wrapper = stats.wrap_method(method_name, method)
+            setattr(self, method_name, wrapper)
+        self.instrumentation = stats
+
+    def wrap_run_query(self, stats: 'DatabaseStats', run_query):
+        '''Returns a wrapper of run_query that also logs slow queries.'''
+        def timed_run_query(query_str: str, parameters=()) -> list[tuple]:
+            start = time.perf_counter()
+            rows = run_query(query_str, parameters)
+            duration_ms = (time.perf_counter() - start)*1000
+            stats.record('run_query', duration_ms, len(rows))
+            if (stats.slow_query_ms is not None 
+                    and duration_ms >= stats.slow_query_ms):
+                stats.log_slow_query(query_str, parameters, duration_ms, 
+                    self.explain_query(query_str, parameters))
+            return rows
+        return timed_run_query
+
+    def disable_instrumentation(self):
+        '''Stops recording statistics, restoring the original methods.'''
+        for method_name in self.instrumented_methods:
+            self.__dict__.pop(method_name, None)
+        self.instrumentation = None
+
+    @contextmanager
+    def instrument(self, slow_query_ms: float = None):
+        '''
+        Records performance statistics within a block of code.
+
+        Yields the DatabaseStats recorder. When the block exits, 
+        instrumentation is returned to its previous state, including 
+        any recorder that was already active.
+        '''
+        previous = self.instrumentation
+        stats = self.enable_instrumentation(slow_query_ms)
+        try:
+            yield stats
+        finally:
+            self.disable_instrumentation()
+            if previous is not None:
+                self.install_instrumentation(previous)
+
+    def stats(self) -> dict:
+        '''
+        Returns a snapshot of the recorded performance statistics.
+
+        The snapshot also includes the hit and miss counts of the spell
+        and query caches. Returns an empty dictionary if instrumentation is off.
+        '''
+        if self.instrumentation is None:
+            return {}
+        return {
+            **self.instrumentation.snapshot(), 
+            'spell_cache': self.spell_cache.info(),
+            'query_cache': self.query_cache.info(),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def initialize_database(self, schema_filename: str):
         '''
         Creates or resets the tables in the database.
@@ -98,20 +598,74 @@ class SpellDataBase:
         school and class are not specified and allowed to be auto-
         generated by sqlite.
         '''
-        connection = self.open_connection()
-        cursor = connection.cursor()
+        connection = self.get_connection()
         with open(schema_filename) as f:
-            cursor.executescript(f.read())
-        classes = [(name,) for name in SpellInfo.classes]
-        cursor.executemany(
-            "INSERT INTO classes (class_name) VALUES (?)", classes
-        )
-        schools = [(name,) for name in SpellInfo.schools]
-        cursor.executemany(
-            "INSERT INTO schools (school_name) VALUES (?)", schools
-        )
-        connection.commit()
-        connection.close()
+            connection.executescript(f.read())
+        self.spell_cache.clear()
+        self.advance_write_generation()
+        with self.transaction() as cursor:
+            classes = [(name,) for name in SpellInfo.classes]
+            cursor.executemany(
+                "INSERT INTO classes (class_name) VALUES (?)", classes
+            )
+            schools = [(name,) for name in SpellInfo.schools]
+            cursor.executemany(
+                "INSERT INTO schools (school_name) VALUES (?)", schools
+            )
+
+    def migrate_database(self, migrations_dir: str = MIGRATIONS_DIR):
+        '''
+        Brings the database up to date with the migration scripts.
+
+        The version of the database is stored in its user_version 
+        pragma. Each migration script in migrations_dir is named with a
+        version number followed by a description, for example 
+        "002_indexes.sql", and every script with a version number higher
+        than the database's is applied in order. Each script is applied
+        in its own transaction together with the update to 
+        user_version, so a script that fails leaves the database at the
+        previous version. The version is checked again once the 
+        transaction holds the write lock, so when several processes 
+        open an old database at once, each script is only applied by 
+        one of them.
+
+        Databases created before the migrations existed have a 
+        user_version of 0 and are upgraded in place.
+
+        Returns the version of the database after migrating.
+        '''
+        connection = self.get_connection()
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        for (script_version, filename) in self.get_migrations(migrations_dir):
+            if script_version <= version:
+                continue
+            with open(os.path.join(migrations_dir, filename)) as f:
+                script = f.read()
+            with self.transaction() as cursor:
+                version = cursor.execute('PRAGMA user_version').fetchone()[0]
+                if script_version <= version:
+                    continue
+                for statement in split_sql_script(script):
+                    cursor.execute(statement)
+                cursor.execute(f'PRAGMA user_version = {script_version}')
+            version = script_version
+        return version
+
+    def get_migrations(self, migrations_dir: str) -> list[tuple[int, str]]:
+        '''
+        Lists the migration scripts in a directory.
+
+        Returns a list of (version, filename) tuples sorted by version.
+        Files that do not start with a version number followed by an 
+        underscore and end in ".sql" are ignored.
+        '''
+        migrations = []
+        for filename in os.listdir(migrations_dir):
+            match = re.fullmatch(r'(\d+)_.*\.sql', filename)
+            if match:
+                migrations.append((int(match.group(1)), filename))
+        migrations.sort()
+        return migrations
 
     def get_ids(self, table: str) -> dict[str, int]:
         '''
@@ -129,69 +683,191 @@ class SpellDataBase:
         method will work for any two-column table where the first 
         column is the rowid and the second column is text.
         '''
-        connection = self.open_connection()
+        connection = self.get_connection()
         cursor = connection.cursor()
         cursor.execute("SELECT * FROM {}".format(table))
         id_dict = {name: id_num for (id_num, name) in cursor.fetchall()}
-        connection.close()
         return id_dict
     
-    def add_spell(self, spell_info: SpellInfo):
+    def get_lookup_ids(self) -> tuple[dict[str, int], dict[str, int]]:
+        '''
+        Gets the class and school IDs with a single query.
+
+        Returns the same dictionaries as get_ids('classes') and 
+        get_ids('schools'), but reads both tables in one query to save
+        a round trip when the database is opened.
+        '''
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT 'classes', class_id, class_name FROM classes\n"
+            "UNION ALL\n"
+            "SELECT 'schools', school_id, school_name FROM schools"
+        )
+        id_dicts = {'classes': {}, 'schools': {}}
+        for (table, id_num, name) in cursor:
+            id_dicts[table][name] = id_num
+        return (id_dicts['classes'], id_dicts['schools'])
+
+    def add_spell(self, spell_info: SpellInfo) -> int:
         '''
         Adds a single spell to the database.
 
         This method adds a row to the spells table containing the
         information of the input SpellInfo object, then adds as many
         rows as needed to the spell_classes table to identify which
-        classes can cast the spell.
+        classes can cast the spell. Both steps happen in one 
+        transaction.
+
+        Returns the spell_id of the new spell.
         '''
         spell_dict = self.convert_spell_to_dict(spell_info)
-        connection = self.open_connection()
-        cursor = connection.cursor()
-        cursor.execute("""
-            INSERT INTO spells (
-                spell_name,
-                spell_level,
-                spell_school,
-                spell_ritual,
-                spell_cast_time,
-                spell_range,
-                spell_concentration,
-                spell_duration,
-                spell_component_v,
-                spell_component_s,
-                spell_component_m,
-                spell_materials,
-                spell_materials_tags,
-                spell_description,
-                spell_description_tags,
-                spell_higher_levels,
-                spell_higher_levels_tags
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO spells (
+                    spell_name,
+                    spell_level,
+                    spell_school,
+                    spell_ritual,
+                    spell_cast_time,
+                    spell_range,
+                    spell_concentration,
+                    spell_duration,
+                    spell_component_v,
+                    spell_component_s,
+                    spell_component_m,
+                    spell_materials,
+                    spell_materials_tags,
+                    spell_description,
+                    spell_description_tags,
+                    spell_higher_levels,
+                    spell_higher_levels_tags
+                )
+                VALUES (
+                    :spell_name,
+                    :spell_level,
+                    :spell_school,
+                    :spell_ritual,
+                    :spell_cast_time,
+                    :spell_range,
+                    :spell_concentration,
+                    :spell_duration,
+                    :spell_component_v,
+                    :spell_component_s,
+                    :spell_component_m,
+                    :spell_materials,
+                    :spell_materials_tags,
+                    :spell_description,
+                    :spell_description_tags,
+                    :spell_higher_levels,
+                    :spell_higher_levels_tags
+                )""", spell_dict
             )
-            VALUES (
-                :spell_name,
-                :spell_level,
-                :spell_school,
-                :spell_ritual,
-                :spell_cast_time,
-                :spell_range,
-                :spell_concentration,
-                :spell_duration,
-                :spell_component_v,
-                :spell_component_s,
-                :spell_component_m,
-                :spell_materials,
-                :spell_materials_tags,
-                :spell_description,
-                :spell_description_tags,
-                :spell_higher_levels,
-                :spell_higher_levels_tags
-            )""", spell_dict
-        )
-        spell_id = cursor.lastrowid
-        connection.commit()
-        connection.close()
-        self.add_class_relations(spell_id, spell_info.get_classes_as_list())
+            spell_id = cursor.lastrowid
+            self.add_class_relations(
+                spell_id, spell_info.get_classes_as_list())
+            self.invalidate_spells((spell_id,))
+            self.record_change(spell_id, None, spell_info)
+        return spell_id
+
+    def add_spells(self, spells: Iterable[SpellInfo], batch_size: int = 500
+            ) -> list[int]:
+        '''
+        Adds many spells to the database in batches.
+
+        This is the bulk equivalent of add_spell. The spells are read 
+        from the iterable batch_size at a time, so generators can be 
+        used to stream very large collections into the database. Each
+        batch is written with one executemany call for the spells table
+        and one for the spell_classes table, and is committed as a 
+        single transaction (unless add_spells is called inside an 
+        enclosing transaction() block, in which case every batch joins
+        that transaction).
+
+        The spell_ids of each batch are assigned in bulk, continuing on
+        from the largest spell_id in the database. This matches the 
+        rowids that sqlite would generate for the rows on its own.
+
+        Returns a list of the spell_ids of the new spells, in the same
+        order as the input.
+        '''
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        spell_ids = []
+        spell_iter = iter(spells)
+        batch = list(islice(spell_iter, batch_size))
+        while batch:
+            spell_ids.extend(self.add_spell_batch(batch))
+            batch = list(islice(spell_iter, batch_size))
+        return spell_ids
+
+    def add_spell_batch(self, spells: list[SpellInfo]) -> list[int]:
+        '''
+        Adds a list of spells to the database in one transaction.
+
+        This method is meant to be called by add_spells, see that method
+        for details.
+        '''
+        spell_dicts = [self.convert_spell_to_dict(spell) for spell in spells]
+        with self.transaction() as cursor:
+            cursor.execute("SELECT IFNULL(MAX(spell_id), 0) FROM spells")
+            first_id = cursor.fetchone()[0] + 1
+            spell_ids = list(range(first_id, first_id + len(spell_dicts)))
+            for (spell_id, spell_dict) in zip(spell_ids, spell_dicts):
+                spell_dict['spell_id'] = spell_id
+            cursor.executemany("""
+                INSERT INTO spells (
+                    spell_id,
+                    spell_name,
+                    spell_level,
+                    spell_school,
+                    spell_ritual,
+                    spell_cast_time,
+                    spell_range,
+                    spell_concentration,
+                    spell_duration,
+                    spell_component_v,
+                    spell_component_s,
+                    spell_component_m,
+                    spell_materials,
+                    spell_materials_tags,
+                    spell_description,
+                    spell_description_tags,
+                    spell_higher_levels,
+                    spell_higher_levels_tags
+                )
+                VALUES (
+                    :spell_id,
+                    :spell_name,
+                    :spell_level,
+                    :spell_school,
+                    :spell_ritual,
+                    :spell_cast_time,
+                    :spell_range,
+                    :spell_concentration,
+                    :spell_duration,
+                    :spell_component_v,
+                    :spell_component_s,
+                    :spell_component_m,
+                    :spell_materials,
+                    :spell_materials_tags,
+                    :spell_description,
+                    :spell_description_tags,
+                    :spell_higher_levels,
+                    :spell_higher_levels_tags
+                )""", spell_dicts
+            )
+            class_relations = chain.from_iterable(
+                ((spell_id, self.class_ids[class_str]) 
+                    for class_str in spell.get_classes_as_list())
+                for (spell_id, spell) in zip(spell_ids, spells)
+            )
+            cursor.executemany(
+                "INSERT INTO spell_classes VALUES (?,?)", class_relations
+            )
+            self.invalidate_spells(spell_ids)
+            for (spell_id, spell) in zip(spell_ids, spells):
+                self.record_change(spell_id, None, spell)
+        return spell_ids
 
     def add_class_relations(self, spell_id: int, class_list: list[str]):
         '''
@@ -204,114 +880,244 @@ class SpellDataBase:
         '''
         used_ids = [self.class_ids[class_str] for class_str in class_list]
         insertion_list = [(spell_id, class_id) for class_id in used_ids]
-        connection = self.open_connection()
-        cursor = connection.cursor()
-        cursor.executemany(
-            "INSERT INTO spell_classes VALUES (?,?)", insertion_list
-        )
-        connection.commit()
-        connection.close()
+        with self.transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO spell_classes VALUES (?,?)", insertion_list
+            )
+            self.invalidate_spells((spell_id,))
 
     def get_spell(self, spell_id: int) -> SpellInfo:
-        connection = self.open_connection()
+        '''
+        Gets a single spell from the database.
+
+        Spells are returned from the spell cache when possible. The 
+        cached SpellInfo objects are shared between callers, so the 
+        returned object should be copied before it is modified.
+        '''
+        self.check_data_version(self.get_connection())
+        spell_info = self.spell_cache.get(spell_id)
+        if spell_info is None:
+            generation = self.spell_cache.generation
+            spell_info = next(self.get_spells((spell_id,)))
+            self.spell_cache.put(spell_id, spell_info, generation)
+        return spell_info
+
+    def get_spells(self, spell_ids: Iterable[int]) -> Iterator[SpellInfo]:
+        '''
+        Gets many spells from the database, in the order of spell_ids.
+
+        This is the batched equivalent of calling get_spell for every 
+        ID. The spells are fetched get_spells_batch_size at a time, with
+        each batch read from the spells and spell_classes tables in a 
+        single query that collects the class IDs of every spell with 
+        group_concat.
+
+        This method is a generator, so only one batch of spells is 
+        held in memory at a time unless the caller keeps them. A 
+        KeyError is raised for any ID that is not in the database.
+        '''
+        yield from self.fetch_in_batches(spell_ids, self.fetch_spell_batch)
+
+    def get_spell_summaries(self, spell_ids: Iterable[int]
+            ) -> Iterator[SpellSummary]:
+        '''
+        Gets the header fields of many spells, in the order of spell_ids.
+
+        This works like get_spells but only reads the columns needed 
+        for SpellSummary objects, skipping the text and tag columns, 
+        which makes it much cheaper for listing and sorting spells. A
+        KeyError is raised for any ID that is not in the database.
+        '''
+        yield from self.fetch_in_batches(spell_ids, self.fetch_summary_batch)
+
+    def fetch_in_batches(self, spell_ids: Iterable[int], 
+            fetch_batch: Callable[[list[int]], dict]) -> Iterator:
+        '''
+        Yields items fetched get_spells_batch_size IDs at a time.
+
+        fetch_batch is called with each list of IDs and must return a 
+        dictionary of items by ID, which are yielded in the order of 
+        spell_ids.
+        '''
+        spell_id_iter = iter(spell_ids)
+        batch = list(islice(spell_id_iter, self.get_spells_batch_size))
+        while batch:
+            items = fetch_batch(batch)
+            for spell_id in batch:
+                yield items[spell_id]
+            batch = list(islice(spell_id_iter, self.get_spells_batch_size))
+
+    def fetch_spell_batch(self, spell_ids: list[int]) -> dict[int, SpellInfo]:
+        '''
+        Gets a list of spells from the database in one query.
+
+        This method is meant to be called by get_spells, see that method
+        for details. Returns a dictionary where the keys are spell IDs 
+        and the values are the SpellInfo objects.
+
+        The tags are left as JSON strings, which SpellInfo decodes the
+        first time they are used.
+        '''
+        connection = self.get_connection()
         cursor = connection.cursor()
-        cursor.execute("SELECT * FROM spells WHERE spell_id = ?", (spell_id,))
-        # There is only 1 result in the cursor because spell_id is a prim. key
-        result = cursor.fetchone()
-        school_name = list(self.school_ids.keys())[
-            list(self.school_ids.values()).index(result[3])
-        ]
-        spell_info = SpellInfo(
-            name=result[1],
-            level=result[2],
-            school=school_name,
-            ritual=bool(result[4]),
-            cast_time=result[5],
-            range=result[6],
-            concentration=bool(result[7]),
-            duration=result[8],
-            components={'V':result[9], 'S':result[10], 'M':result[11]},
-            materials=result[12],
-            materials_tags=json.loads(result[13]),
-            description=result[14],
-            description_tags=json.loads(result[15]),
-            higher_levels=result[16],
-            higher_levels_tags=json.loads(result[17]),
-            in_class_spell_list={}
+        cursor.execute(
+            "SELECT spells.*, group_concat(spell_classes.class_id)\n"
+            "FROM spells\n"
+            "LEFT JOIN spell_classes "
+            "ON spells.spell_id = spell_classes.spell_id\n"
+            "WHERE spells.spell_id IN ({seq})\n"
+            "GROUP BY spells.spell_id".format(
+                seq = ','.join(['?']*len(spell_ids))
+            ), spell_ids
         )
+        spells = {}
+        for result in cursor:
+            spells[result[0]] = SpellInfo(
+                name=result[1],
+                level=result[2],
+                school=self.school_names[result[3]],
+                ritual=bool(result[4]),
+                cast_time=result[5],
+                range=result[6],
+                concentration=bool(result[7]),
+                duration=result[8],
+                components={'V':result[9], 'S':result[10], 'M':result[11]},
+                materials=result[12],
+                materials_tags=result[13],
+                description=result[14],
+                description_tags=result[15],
+                higher_levels=result[16],
+                higher_levels_tags=result[17],
+                in_class_spell_list=self.class_dict_from_ids(result[18])
+            )
+        return spells
+
+    def fetch_summary_batch(self, spell_ids: list[int]
+            ) -> dict[int, SpellSummary]:
+        '''
+        Gets the summaries of a list of spells from the database.
+
+        This method is meant to be called by get_spell_summaries, see 
+        that method for details.
+        '''
+        cursor = self.get_connection().cursor()
         cursor.execute(
-            "SELECT class_id FROM spell_classes WHERE spell_id = ?", 
-            (spell_id,)
+            "SELECT spells.spell_id, spell_name, spell_level, spell_school,\n"
+            "    spell_ritual, spell_cast_time, spell_range,\n"
+            "    spell_concentration, spell_duration, spell_component_v,\n"
+            "    spell_component_s, spell_component_m,\n"
+            "    group_concat(spell_classes.class_id)\n"
+            "FROM spells\n"
+            "LEFT JOIN spell_classes "
+            "ON spells.spell_id = spell_classes.spell_id\n"
+            "WHERE spells.spell_id IN ({seq})\n"
+            "GROUP BY spells.spell_id".format(
+                seq = ','.join(['?']*len(spell_ids))
+            ), spell_ids
         )
-        result = cursor.fetchall()
-        # result is a list of single-value tuples, which can be a simple list:
-        result = [v[0] for v in result]
-        class_membership = {k: v in result for (k, v) 
-            in self.class_ids.items()
+        summaries = {}
+        for result in cursor:
+            summaries[result[0]] = SpellSummary(
+                spell_id=result[0],
+                name=result[1],
+                level=result[2],
+                school=self.school_names[result[3]],
+                ritual=bool(result[4]),
+                cast_time=result[5],
+                range=result[6],
+                concentration=bool(result[7]),
+                duration=result[8],
+                components={'V':result[9], 'S':result[10], 'M':result[11]},
+                in_class_spell_list=self.class_dict_from_ids(result[12])
+            )
+        return summaries
+
+    def class_dict_from_ids(self, class_ids: str) -> dict[str, bool]:
+        '''
+        Converts a group_concat list of class IDs to a class dictionary.
+
+        Example input and output:
+        class_ids = '2,8'
+
+        output: {'Bard': False, 'Cleric': True, ..., 'Wizard': True}
+        '''
+        class_id_set = set()
+        if class_ids:
+            class_id_set = {int(v) for v in class_ids.split(',')}
+        return {
+            class_name: class_id in class_id_set
+            for (class_name, class_id) in self.class_ids.items()
         }
-        spell_info.in_class_spell_list.update(class_membership)
-        return spell_info
+
+    def get_spell_id(self, spell_name: str) -> int:
+        '''Returns the ID of the spell with a name, or None if not found.'''
+        cursor = self.get_connection().cursor()
+        cursor.execute(
+            "SELECT spell_id FROM spells WHERE spell_name = ?", (spell_name,)
+        )
+        result = cursor.fetchone()
+        return result[0] if result is not None else None
 
     def get_spell_list(self) -> dict[str, int]:
-        connection = self.open_connection()
+        connection = self.get_connection()
         cursor = connection.cursor()
         cursor.execute("SELECT spell_id, spell_name FROM spells ORDER BY spell_name ASC")
         spell_list = {name: spell_id for (spell_id, name) in cursor.fetchall()}
-        connection.close()
         return spell_list
 
     def update_spell(self, spell_id: int, spell_info: SpellInfo):
         spell_dict = self.convert_spell_to_dict(spell_info)
         spell_dict['spell_id'] = spell_id
-        connection = self.open_connection()
-        cursor = connection.cursor()
-        cursor.execute("""
-            UPDATE spells 
-            SET
-                spell_name = :spell_name,
-                spell_level = :spell_level,
-                spell_school = :spell_school,
-                spell_ritual = :spell_ritual,
-                spell_cast_time = :spell_cast_time,
-                spell_range = :spell_range,
-                spell_concentration = :spell_concentration,
-                spell_duration = :spell_duration,
-                spell_component_v = :spell_component_v,
-                spell_component_s = :spell_component_s,
-                spell_component_m = :spell_component_m,
-                spell_materials = :spell_materials,
-                spell_materials_tags = :spell_materials_tags,
-                spell_description = :spell_description,
-                spell_description_tags = :spell_description_tags,
-                spell_higher_levels = :spell_higher_levels,
-                spell_higher_levels_tags = :spell_higher_levels_tags
-            WHERE spell_id = :spell_id
-            """, spell_dict
-        )
-        connection.commit()
-        connection.close()
-        self.del_class_relations(spell_id)
-        self.add_class_relations(spell_id, spell_info.get_classes_as_list())
+        with self.transaction() as cursor:
+            before = self.get_change_summary(spell_id)
+            cursor.execute("""
+                UPDATE spells 
+                SET
+                    spell_name = :spell_name,
+                    spell_level = :spell_level,
+                    spell_school = :spell_school,
+                    spell_ritual = :spell_ritual,
+                    spell_cast_time = :spell_cast_time,
+                    spell_range = :spell_range,
+                    spell_concentration = :spell_concentration,
+                    spell_duration = :spell_duration,
+                    spell_component_v = :spell_component_v,
+                    spell_component_s = :spell_component_s,
+                    spell_component_m = :spell_component_m,
+                    spell_materials = :spell_materials,
+                    spell_materials_tags = :spell_materials_tags,
+                    spell_description = :spell_description,
+                    spell_description_tags = :spell_description_tags,
+                    spell_higher_levels = :spell_higher_levels,
+                    spell_higher_levels_tags = :spell_higher_levels_tags
+                WHERE spell_id = :spell_id
+                """, spell_dict
+            )
+            self.del_class_relations(spell_id)
+            self.add_class_relations(
+                spell_id, spell_info.get_classes_as_list())
+            self.invalidate_spells((spell_id,))
+            if before is not None:
+                self.record_change(spell_id, before, spell_info)
 
     def del_class_relations(self, spell_id):
-        connection = self.open_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "DELETE FROM spell_classes WHERE spell_id = ?", (spell_id,)
-        )
-        connection.commit()
-        connection.close()
+        with self.transaction() as cursor:
+            cursor.execute(
+                "DELETE FROM spell_classes WHERE spell_id = ?", (spell_id,)
+            )
+            self.invalidate_spells((spell_id,))
 
     def del_spell(self, spell_id: int):
-        # Deletes class relations first to obey foreign key constraint
-        self.del_class_relations(spell_id)
-        connection = self.open_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "DELETE FROM spells WHERE spell_id = ?", (spell_id,)
-        )
-        connection.commit()
-        connection.close()
+        with self.transaction() as cursor:
+            before = self.get_change_summary(spell_id)
+            # The class relations are removed by the ON DELETE CASCADE
+            # of the spell_classes foreign key
+            cursor.execute(
+                "DELETE FROM spells WHERE spell_id = ?", (spell_id,)
+            )
+            self.invalidate_spells((spell_id,))
+            if before is not None:
+                self.record_change(spell_id, before)
 
     def convert_spell_to_dict(self, spell_info: SpellInfo) -> dict:
         '''
@@ -323,7 +1129,7 @@ class SpellDataBase:
         The format expected by the database for spells differs from how
         they are stored in SpellInfo objects. For example, the school
         is stored as an integer in the database rather than a string,
-        and the tags must be stored as strings using the json format.
+        and the tags must be stored as JSON strings.
         Also, booleans are stored as integers. While some of these 
         conversions could be performed implicitly by sqlite, this method
         explicitly converts each element to a type recognized by sqlite.
@@ -342,12 +1148,12 @@ class SpellDataBase:
             'spell_component_s': int(spell_info.components['S']),
             'spell_component_m': int(spell_info.components['M']),
             'spell_materials': spell_info.materials,
-            'spell_materials_tags': json.dumps(spell_info.materials_tags),
+            'spell_materials_tags': spell_info.materials_tags.to_json(),
             'spell_description': spell_info.description,
-            'spell_description_tags': json.dumps(spell_info.description_tags),
+            'spell_description_tags': spell_info.description_tags.to_json(),
             'spell_higher_levels': spell_info.higher_levels,
-            'spell_higher_levels_tags': json.dumps(
-                spell_info.higher_levels_tags),
+            'spell_higher_levels_tags': (
+                spell_info.higher_levels_tags.to_json()),
         }
         return spell_dict
 
@@ -358,6 +1164,250 @@ class SpellDataBase:
             ritual: int=0) -> dict[str, int]:
         query_str = ("SELECT spells.spell_id, spells.spell_name\n"
             "FROM spells\n")
+        (join_str, query_statements, parameters) = self.build_filter_query(
+            class_dict, level, school, ritual
+        )
+        # Appending all the statements to create the final query
+        query_str += join_str
+        if query_statements:
+            query_str += "WHERE "
+            query_str += " AND ".join(query_statements) + "\n"
+        query_str += "ORDER BY spells.spell_name ASC"
+        filter_key = self.normalize_filters(class_dict, level, school, ritual)
+        rows = self.cached_query(
+            ('query_spells', filter_key), query_str, tuple(parameters)
+        )
+        spell_list = {name: spell_id for (spell_id, name) in rows}
+        return spell_list
+
+    def paginate_spells(self, *, 
+            class_dict: dict[str, bool]=None, 
+            level: int=-1,
+            school: str="",
+            ritual: int=0,
+            page_size: int=100) -> 'SpellPager':
+        '''
+        Returns a lazy, paginated handle on a filtered list of spells.
+
+        The filters are the same as the keyword arguments of 
+        query_spells, but rather than reading every matching spell into
+        a dictionary, the returned SpellPager reads page_size spells at
+        a time on request. See SpellPager for details.
+        '''
+        (join_str, query_statements, parameters) = self.build_filter_query(
+            class_dict, level, school, ritual
+        )
+        return SpellPager(
+            self, page_size, join_str, query_statements, parameters,
+            self.normalize_filters(class_dict, level, school, ritual)
+        )
+
+    def search_spells(self, text: str, *,
+            class_dict: dict[str, bool]=None,
+            level: int=-1,
+            school: str="",
+            ritual: int=0) -> dict[str, int]:
+        '''
+        Searches the text of the spells, ranked by relevance.
+
+        The spell names, descriptions, materials and "at higher levels"
+        text are searched with the spells_fts full-text index. Every
+        word in text must appear in a spell for it to match, and the
+        last word also matches as a prefix, so partially typed words
+        find results. Matches in the spell name are weighted more
+        heavily than matches in the other columns.
+
+        The keyword arguments filter the results the same way as in
+        query_spells, and are applied in the same SQL query as the text
+        search. If text contains no words, the result is the same as
+        query_spells.
+
+        Returns a dictionary of spell names and IDs like query_spells,
+        ordered from the best match to the worst.
+        '''
+        match_str = self.build_fts_query(text)
+        if not match_str:
+            return self.query_spells(
+                class_dict=class_dict, level=level, school=school,
+                ritual=ritual
+            )
+        query_str = ("SELECT spells.spell_id, spells.spell_name\n"
+            "FROM spells_fts\n"
+            "JOIN spells ON spells.spell_id = spells_fts.rowid\n")
+        (join_str, query_statements, parameters) = self.build_filter_query(
+            class_dict, level, school, ritual
+        )
+        query_str += join_str
+        query_str += "WHERE "
+        query_str += " AND ".join(["spells_fts MATCH ?", *query_statements])
+        query_str += "\nORDER BY bm25(spells_fts, 10.0, 1.0, 1.0, 1.0), "
+        query_str += "spells.spell_name ASC"
+        rows = self.run_query(query_str, (match_str, *parameters))
+        spell_list = {name: spell_id for (spell_id, name) in rows}
+        return spell_list
+
+    def run_query(self, query_str: str, parameters=()) -> list[tuple]:
+        '''Runs a read-only query and returns every resulting row.'''
+        cursor = self.get_connection().cursor()
+        cursor.execute(query_str, parameters)
+        return cursor.fetchall()
+
+    def cached_query(self, key: tuple, query_str: str, parameters=()
+            ) -> list[tuple]:
+        '''
+        Runs a query with run_query, reusing earlier results for key.
+
+        The rows are returned from the query cache if the query was run
+        with the same key and write_generation is unchanged since. The 
+        returned list is shared between callers and must not be 
+        modified. Queries inside a transaction() block are not cached,
+        as they may see changes that are not committed yet.
+        '''
+        connection = self.get_connection()
+        if connection.in_transaction:
+            return self.run_query(query_str, parameters)
+        self.check_data_version(connection)
+        generation = self.write_generation
+        cached = self.query_cache.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        rows = self.run_query(query_str, parameters)
+        self.query_cache.put(key, (generation, rows))
+        return rows
+
+    def normalize_filters(self, class_dict: dict[str, bool], level: int,
+            school: str, ritual: int) -> tuple:
+        '''
+        Converts query filters to a canonical, hashable form.
+
+        Filters that select the same spells give the same result, for 
+        example any class_dict with no classes or all classes selected 
+        and any negative level all mean "no filter".
+
+        Example input and output:
+        class_dict = {'Wizard': True, 'Bard': True, 'Cleric': False}
+        level = -2, school = '', ritual = 1
+
+        output: (('Bard', 'Wizard'), -1, '', 1)
+        '''
+        classes = ()
+        if (class_dict is not None 
+                and any(class_dict.values()) and not all(class_dict.values())):
+            classes = tuple(sorted(compress(class_dict, class_dict.values())))
+        return (classes, max(level, -1), school or '', ritual or 0)
+
+    def explain_query(self, query_str: str, parameters=()) -> list[str]:
+        '''Returns the steps of SQLite's query plan for a query.'''
+        cursor = self.get_connection().cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + query_str, parameters)
+        return [row[3] for row in cursor]
+
+    def facet_counts(self, *,
+            class_dict: dict[str, bool]=None,
+            level: int=-1,
+            school: str="",
+            ritual: int=0) -> dict:
+        '''
+        Counts the spells that each filter option would give.
+
+        The keyword arguments are the current filters, the same as for
+        query_spells. For each class, level and school, the count is 
+        the number of spells that would match if that option were 
+        chosen while the other filters stay the same, and the ritual 
+        count is the number of matching spells if the ritual filter 
+        were on. The total is the number of spells matching the current
+        filters.
+
+        Example output:
+        {
+            'total': 12,
+            'classes': {'Bard': 3, 'Cleric': 0, ...},
+            'levels': {0: 4, 1: 12, ...},
+            'schools': {'Abjuration': 1, ...},
+            'ritual': 2,
+        }
+
+        The counts are computed from a single grouped query that counts
+        the spells for every combination of class list, level, school 
+        and ritual. That query does not depend on the filters, so it is
+        kept in the query cache and changing the filters is cheap.
+        '''
+        rows = self.cached_query(('facet_counts',), 
+            "SELECT class_mask, spell_level, spell_school, spell_ritual,\n"
+            "    COUNT(*)\n"
+            "FROM (\n"
+            "    SELECT spells.spell_id, spell_level, spell_school,\n"
+            "        spell_ritual,\n"
+            "        IFNULL(SUM(1 << spell_classes.class_id), 0)"
+            " AS class_mask\n"
+            "    FROM spells\n"
+            "    LEFT JOIN spell_classes "
+            "ON spells.spell_id = spell_classes.spell_id\n"
+            "    GROUP BY spells.spell_id\n"
+            ")\n"
+            "GROUP BY 1, 2, 3, 4"
+        )
+        (classes, level, school, ritual) = self.normalize_filters(
+            class_dict, level, school, ritual)
+        selected_mask = sum(1 << self.class_ids[name] for name in classes)
+        school_id = self.school_ids[school] if school else None
+        counts = {
+            'total': 0,
+            'classes': dict.fromkeys(self.class_ids, 0),
+            'levels': dict.fromkeys(range(len(SpellInfo.levels)), 0),
+            'schools': dict.fromkeys(self.school_ids, 0),
+            'ritual': 0,
+        }
+        for (mask, row_level, row_school, row_ritual, number) in rows:
+            class_match = not selected_mask or bool(mask & selected_mask)
+            level_match = level < 0 or row_level == level
+            school_match = school_id is None or row_school == school_id
+            ritual_match = not ritual or row_ritual == ritual
+            if level_match and school_match and ritual_match:
+                for (name, class_id) in self.class_ids.items():
+                    if mask >> class_id & 1:
+                        counts['classes'][name] += number
+            if class_match and school_match and ritual_match:
+                counts['levels'][row_level] += number
+            if class_match and level_match and ritual_match:
+                counts['schools'][self.school_names[row_school]] += number
+            if class_match and level_match and school_match:
+                if row_ritual:
+                    counts['ritual'] += number
+                if ritual_match:
+                    counts['total'] += number
+        return counts
+
+    def build_fts_query(self, text: str) -> str:
+        '''
+        Converts user-entered text into an FTS5 query string.
+
+        Each word is quoted so that punctuation and FTS5 keywords such
+        as AND or NOT in the text are searched for literally rather than
+        interpreted as query syntax. The last word is made a prefix
+        query.
+
+        Example input and output:
+        text = 'fire OR ball'
+
+        output: '"fire" "OR" "ball"*'
+        '''
+        words = ['"{}"'.format(word.replace('"', '""'))
+            for word in text.split()]
+        if words:
+            words[-1] += '*'
+        return ' '.join(words)
+
+    def build_filter_query(self, class_dict: dict[str, bool], level: int,
+            school: str, ritual: int) -> tuple[str, list[str], list]:
+        '''
+        Builds the JOIN and WHERE parts of a filtered spell query.
+
+        The filters are the same as the keyword arguments of
+        query_spells. Returns a tuple of the JOIN statements as a single
+        string, a list of the conditions to be combined with AND in the
+        WHERE clause, and a list of the parameters for the conditions.
+        '''
         join_statements = []
         query_statements = []
         parameters = []
@@ -365,33 +1415,22 @@ class SpellDataBase:
         join_statements.append(class_join)
         if classes:
             query_statements.append(class_query)
-            parameters.append(*classes)
+            parameters.extend(classes)
         (level_query, level) = self.build_level_query(level)
         if level:
             query_statements.append(level_query)
-            parameters.append(*level)
+            parameters.extend(level)
         (school_join, school_query, school) = self.build_school_query(school)
         join_statements.append(school_join)
         if school:
             query_statements.append(school_query)
-            parameters.append(*school)
+            parameters.extend(school)
         if ritual:
             ritual_query = "spells.spell_ritual = ?"
             query_statements.append(ritual_query)
             parameters.append(ritual)
-        # Appending all the statements to create the final query
-        query_str += "".join(join_statements)
-        if parameters:
-            query_str += "WHERE "
-            query_str += " AND ".join(query_statements) + "\n"
-        query_str += "ORDER BY spells.spell_name ASC"
-        connection = self.open_connection()
-        cursor = connection.cursor()
-        cursor.execute(query_str, tuple(parameters))
-        spell_list = {name: spell_id for (spell_id, name) in cursor.fetchall()}
-        connection.close()
-        return spell_list
-    
+        return ("".join(join_statements), query_statements, parameters)
+
     def build_class_query(self, class_dict: dict[str, bool]
             ) -> tuple[str, str, tuple[str]]:
         join_str = ""
@@ -433,6 +1472,477 @@ class SpellDataBase:
         return (join_str, query_str, school)
 
 
+class SpellPager:
+    '''
+    A lazy, paginated view of a filtered list of spells.
+
+    SpellPager objects are created by SpellDataBase.paginate_spells and
+    do not run any query until a page, the count, or an iteration is
+    requested. Spells are ordered by name, with the spell_id breaking 
+    ties, and every row is a (spell_id, spell_name) tuple.
+
+    Pages are found by keyset pagination: instead of skipping rows with
+    OFFSET, which makes SQLite step over every skipped row, each page 
+    seeks directly to the (spell_name, spell_id) key of the last row of
+    the previous page using the spells_name_idx index. The cost of 
+    reading a page therefore does not depend on how far into the list
+    it is.
+
+    Pagers created with normalized filters run their queries through
+    the database's query cache, so a list that is shown again after 
+    switching between filters is read without any SQL as long as the
+    spells are unchanged. The returned pages are then shared and must 
+    not be modified.
+
+    Example:
+
+    pager = spell_db.paginate_spells(level=3, page_size=50)
+    total = pager.count()
+    first_page = pager.page_after()
+    next_page = pager.page_after(first_page[-1])
+    for (spell_id, spell_name) in pager:
+        ...
+    '''
+    def __init__(self, spell_db: 'SpellDataBase', page_size: int, 
+            join_str: str, query_statements: list[str], parameters: list,
+            filter_key: tuple = None):
+        self.spell_db = spell_db
+        self.filter_key = filter_key
+        self.page_size = page_size
+        self.join_str = join_str
+        self.query_statements = query_statements
+        self.parameters = parameters
+
+    def count(self) -> int:
+        '''Returns the total number of spells matching the filters.'''
+        (query_str, parameters) = self.build_query(
+            "SELECT COUNT(DISTINCT spells.spell_id)\n", [], []
+        )
+        return self.run_query(('count',), query_str, parameters)[0][0]
+
+    def page_after(self, key: tuple[int, str] = None, limit: int = None
+            ) -> list[tuple[int, str]]:
+        '''
+        Returns the page of spells that follows a row.
+
+        key is a (spell_id, spell_name) row previously returned by this 
+        pager, usually the last row of the previous page. If key is 
+        None, the first page is returned. Returns up to limit rows, 
+        which defaults to the pager's page_size.
+        '''
+        conditions = []
+        parameters = []
+        if key is not None:
+            conditions.append("(spells.spell_name, spells.spell_id) > (?, ?)")
+            parameters.extend((key[1], key[0]))
+        return self.fetch_page(conditions, parameters, "ASC", limit)
+
+    def page_before(self, key: tuple[int, str], limit: int = None
+            ) -> list[tuple[int, str]]:
+        '''
+        Returns the page of spells that precedes a row.
+
+        This is the reverse of page_after, used to scroll backwards. The
+        rows are still returned in ascending order.
+        '''
+        conditions = ["(spells.spell_name, spells.spell_id) < (?, ?)"]
+        parameters = [key[1], key[0]]
+        page = self.fetch_page(conditions, parameters, "DESC", limit)
+        return page[::-1]
+
+    def page_from(self, spell_name: str, limit: int = None
+            ) -> list[tuple[int, str]]:
+        '''
+        Returns the page of spells starting at a spell name.
+
+        The first row is the first spell whose name is equal to or 
+        sorts after spell_name, so this can be used to jump to a spell
+        or to the first spell starting with some text.
+        '''
+        conditions = ["spells.spell_name >= ?"]
+        return self.fetch_page(conditions, [spell_name], "ASC", limit)
+
+    def page_at(self, offset: int, limit: int = None
+            ) -> list[tuple[int, str]]:
+        '''
+        Returns the page of spells starting at a position in the list.
+
+        Unlike the other page methods, this uses OFFSET, so SQLite steps
+        over every row before the offset. It is only meant for jumping
+        to an arbitrary position, after which page_after and page_before
+        should be used.
+        '''
+        if limit is None:
+            limit = self.page_size
+        (query_str, parameters) = self.build_query(
+            "SELECT DISTINCT spells.spell_id, spells.spell_name\n", [], []
+        )
+        query_str += ("ORDER BY spells.spell_name ASC, spells.spell_id ASC\n"
+            "LIMIT ? OFFSET ?")
+        return self.run_query(
+            ('page_at', offset, limit), query_str, (*parameters, limit, offset)
+        )
+
+    def count_before(self, spell_name: str, spell_id: int = None) -> int:
+        '''
+        Returns the number of spells that sort before a name.
+
+        If spell_id is given, spells with the same name and a lower 
+        spell_id are also counted, which gives the position of the row
+        (spell_id, spell_name) in the list.
+        '''
+        if spell_id is None:
+            conditions = ["spells.spell_name < ?"]
+            parameters = [spell_name]
+        else:
+            conditions = ["(spells.spell_name, spells.spell_id) < (?, ?)"]
+            parameters = [spell_name, spell_id]
+        key = ('count_before', spell_name, spell_id)
+        (query_str, parameters) = self.build_query(
+            "SELECT COUNT(DISTINCT spells.spell_id)\n", conditions, parameters
+        )
+        return self.run_query(key, query_str, parameters)[0][0]
+
+    def includes(self, summary: SpellSummary) -> bool:
+        '''
+        Returns whether a spell matches the filters of this pager.
+
+        This checks the filters against a SpellSummary in memory, for 
+        deciding whether a changed spell belongs in the list without 
+        querying the database.
+        '''
+        if self.filter_key is None:
+            raise ValueError('The pager has no normalized filters')
+        (classes, level, school, ritual) = self.filter_key
+        return ((not classes 
+                or any(summary.in_class_spell_list.get(c) for c in classes))
+            and (level < 0 or summary.level == level)
+            and (not school or summary.school == school)
+            and (not ritual or bool(summary.ritual)))
+
+    def pages(self) -> Iterator[list[tuple[int, str]]]:
+        '''Yields every page of spells in order.'''
+        page = self.page_after()
+        while page:
+            yield page
+            page = self.page_after(page[-1])
+
+    def __iter__(self) -> Iterator[tuple[int, str]]:
+        for page in self.pages():
+            yield from page
+
+    def fetch_page(self, conditions: list[str], parameters: list, 
+            direction: str, limit: int = None) -> list[tuple[int, str]]:
+        if limit is None:
+            limit = self.page_size
+        order_str = "ORDER BY spells.spell_name {0}, spells.spell_id {0}\n"
+        key = ('page', tuple(conditions), tuple(parameters), direction, limit)
+        (query_str, parameters) = self.build_query(
+            "SELECT DISTINCT spells.spell_id, spells.spell_name\n", 
+            conditions, parameters
+        )
+        query_str += order_str.format(direction) + "LIMIT ?"
+        return self.run_query(key, query_str, (*parameters, limit))
+
+    def run_query(self, key: tuple, query_str: str, parameters
+            ) -> list[tuple]:
+        # Results can only be shared between pagers with the same 
+        # normalized filters
+        if self.filter_key is None:
+            return self.spell_db.run_query(query_str, parameters)
+        return self.spell_db.cached_query(
+            (key[0], self.filter_key, *key[1:]), query_str, parameters)
+
+    def build_query(self, select_str: str, conditions: list[str], 
+            parameters: list) -> tuple[str, list]:
+        query_statements = [*self.query_statements, *conditions]
+        query_str = select_str + "FROM spells\n" + self.join_str
+        if query_statements:
+            query_str += "WHERE " + " AND ".join(query_statements) + "\n"
+        return (query_str, [*self.parameters, *parameters])
+
+
+class PagedSpellList:
+    '''
+    A positional, read-only view of the spells of a SpellPager.
+
+    PagedSpellList lets a list widget ask for "rows 500 to 530" without
+    reading the whole list of spells. Rows are read from the pager in 
+    blocks of the pager's page_size and the most recently used blocks 
+    are cached. Blocks next to a cached block are found with the 
+    pager's keyset pagination, so scrolling through the list never 
+    skips rows with OFFSET; only jumps to an arbitrary position (for 
+    example by dragging a scrollbar) do.
+
+    Rows are (spell_id, spell_name) tuples, as returned by SpellPager.
+
+    A single spell change can be applied with insert_row and remove_row
+    instead of reading the list again. To tell the blocks that were read
+    before a change from those that already include it, every block and
+    the length are tagged with the write_generation of the database at
+    the time they were read.
+    '''
+    def __init__(self, pager: SpellPager, max_blocks: int = 32):
+        self.pager = pager
+        self.block_size = pager.page_size
+        # Values are (write_generation, rows) tuples
+        self.blocks = LRUCache(max_blocks)
+        self.length = None
+        self.length_generation = None
+
+    def __len__(self) -> int:
+        if self.length is None:
+            self.length_generation = self.pager.spell_db.write_generation
+            self.length = self.pager.count()
+        return self.length
+
+    def rows(self, start: int, stop: int) -> list[tuple[int, str]]:
+        '''Returns the rows at positions start to stop - 1.'''
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        first_block = start // self.block_size
+        last_block = (stop - 1) // self.block_size
+        rows = []
+        for block_index in range(first_block, last_block + 1):
+            rows.extend(self.get_block(block_index))
+        offset = start - first_block*self.block_size
+        return rows[offset:offset + stop - start]
+
+    def cached_rows(self, start: int, stop: int) -> list[tuple[int, str]]:
+        '''
+        Returns the rows at positions start to stop - 1 without a query.
+
+        Rows whose block is not cached are returned as None, so that a
+        list widget can show them as placeholders while rows() reads 
+        them on another thread.
+        '''
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        first_block = start // self.block_size
+        last_block = (stop - 1) // self.block_size
+        rows = []
+        for block_index in range(first_block, last_block + 1):
+            entry = self.blocks.get(block_index)
+            if entry is None:
+                rows.extend([None]*self.block_size)
+            else:
+                rows.extend(entry[1])
+        offset = start - first_block*self.block_size
+        return rows[offset:offset + stop - start]
+
+    def get_block(self, block_index: int) -> list[tuple[int, str]]:
+        entry = self.blocks.get(block_index)
+        if entry is None:
+            generation = self.pager.spell_db.write_generation
+            previous_block = self.blocks.get(block_index - 1, (0, []))[1]
+            next_block = self.blocks.get(block_index + 1, (0, []))[1]
+            if previous_block:
+                block = self.pager.page_after(previous_block[-1])
+            elif next_block:
+                block = self.pager.page_before(next_block[0])
+            else:
+                block = self.pager.page_at(block_index*self.block_size)
+            entry = (generation, block)
+            self.blocks.put(block_index, entry)
+        return entry[1]
+
+    def blocks_before(self, generation: int, first_block: int
+            ) -> dict[int, tuple[int, list[tuple[int, str]]]]:
+        '''Returns the cached blocks from first_block read before generation.'''
+        return {
+            block_index: entry for (block_index, entry)
+            in sorted(self.blocks.items())
+            if block_index >= first_block and entry[0] < generation
+        }
+
+    def insert_row(self, position: int, row: tuple[int, str], 
+            generation: int):
+        '''
+        Inserts a row into the cached blocks of the list.
+
+        row is a spell that joined the list in the change committed at 
+        generation, and position is its position in the list after the 
+        change. Cached blocks from position onward that were read before
+        the change are shifted down by one row, each taking its new 
+        first row from the end of the block before it. A block whose 
+        previous block is not cached cannot be shifted and is discarded.
+
+        The shifted blocks keep the generation they were read at, so 
+        that a spell that moves within the list can be removed and 
+        inserted again with the same generation.
+        '''
+        if self.length is not None and self.length_generation < generation:
+            self.length += 1
+        first_block = position // self.block_size
+        offset = position - first_block*self.block_size
+        old_blocks = self.blocks_before(generation, first_block)
+        for (block_index, (block_generation, block)) in old_blocks.items():
+            if block_index == first_block and offset <= len(block):
+                block = [*block[:offset], row, *block[offset:]]
+            elif block_index > first_block and block_index - 1 in old_blocks:
+                block = [old_blocks[block_index - 1][1][-1], *block]
+            else:
+                self.blocks.pop(block_index)
+                continue
+            self.blocks.put(
+                block_index, (block_generation, block[:self.block_size])
+            )
+
+    def remove_row(self, position: int, generation: int):
+        '''
+        Removes a row from the cached blocks of the list.
+
+        This is the reverse of insert_row, position is the position of
+        the row before the change committed at generation. Cached blocks
+        from position onward that were read before the change are 
+        shifted up by one row, each taking its new last row from the 
+        start of the block after it, and are discarded if that block is
+        not cached.
+        '''
+        if self.length is not None and self.length_generation < generation:
+            self.length -= 1
+        first_block = position // self.block_size
+        offset = position - first_block*self.block_size
+        old_blocks = self.blocks_before(generation, first_block)
+        for (block_index, (block_generation, block)) in old_blocks.items():
+            if block_index == first_block:
+                if offset >= len(block):
+                    self.blocks.pop(block_index)
+                    continue
+                new_block = [*block[:offset], *block[offset + 1:]]
+            else:
+                new_block = block[1:]
+            if len(block) == self.block_size:
+                (_, next_block) = old_blocks.get(block_index + 1, (0, []))
+                if next_block:
+                    new_block.append(next_block[0])
+                elif (self.length is None 
+                        or (block_index + 1)*self.block_size <= self.length):
+                    # The block was full and is followed by rows that 
+                    # are not cached
+                    self.blocks.pop(block_index)
+                    continue
+            if new_block:
+                self.blocks.put(block_index, (block_generation, new_block))
+            else:
+                self.blocks.pop(block_index)
+
+    def find(self, spell_name: str) -> int:
+        '''
+        Returns the position of a spell name in the list.
+
+        If the name is not in the list, the position of the first spell
+        that sorts after it is returned instead, which may be equal to 
+        the length of the list. The position is found with an index 
+        seek followed by an index-only count of the preceding rows.
+        '''
+        return self.pager.count_before(spell_name)
+
+    def invalidate(self):
+        '''Discards the cached rows and length after the spells change.'''
+        self.blocks.clear()
+        self.length = None
+
+
+class SpellNameIndex:
+    '''
+    An in-memory index for searching spell names by prefix.
+
+    The (spell_id, spell_name) rows of a spell list are sorted by their
+    casefolded names once, after which every search is a binary search
+    for the range of names starting with the search text, ignoring 
+    case. This is fast enough to search while the user types, even for 
+    very large spell lists.
+
+    Searches usually extend the previous search by one character, so 
+    when the new search text starts with the previous one, the new 
+    range is only searched for within the previous range.
+
+    search() returns a SpellNameMatches object, which can be displayed 
+    by a VirtualListbox in the same way as a PagedSpellList.
+    '''
+    # Sorts after every character, so every name starting with a prefix
+    # sorts before the prefix followed by this character
+    max_char = chr(0x10ffff)
+
+    def __init__(self, rows: Iterable[tuple[int, str]], 
+            generation: int = None):
+        '''
+        Indexes rows of (spell_id, spell_name) tuples.
+
+        generation is the write_generation of the database when the 
+        rows were read, which lets insert_row and remove_row skip 
+        changes that the rows already include.
+        '''
+        entries = sorted(
+            (spell_name.casefold(), spell_id, spell_name) 
+            for (spell_id, spell_name) in rows
+        )
+        self.keys = [key for (key, spell_id, spell_name) in entries]
+        self.rows = [
+            (spell_id, spell_name) for (key, spell_id, spell_name) in entries
+        ]
+        self.generation = generation
+        self.last_search = ('', 0, len(self.keys))
+
+    def position(self, row: tuple[int, str]) -> int:
+        '''Returns the position at which a row is or would be indexed.'''
+        (spell_id, spell_name) = row
+        key = spell_name.casefold()
+        start = bisect_left(self.keys, key)
+        stop = bisect_right(self.keys, key, start)
+        # Names that are equal ignoring case are sorted by spell_id
+        return bisect_left(self.rows, spell_id, start, stop, key=itemgetter(0))
+
+    def insert_row(self, row: tuple[int, str], generation: int):
+        '''Adds a row for a spell that joined the list at generation.'''
+        if self.generation is not None and self.generation >= generation:
+            return
+        index = self.position(row)
+        self.keys.insert(index, row[1].casefold())
+        self.rows.insert(index, row)
+        self.last_search = ('', 0, len(self.keys))
+
+    def remove_row(self, row: tuple[int, str], generation: int):
+        '''Removes the row of a spell that left the list at generation.'''
+        if self.generation is not None and self.generation >= generation:
+            return
+        index = self.position(row)
+        if index < len(self.rows) and self.rows[index] == row:
+            del self.keys[index]
+            del self.rows[index]
+            self.last_search = ('', 0, len(self.keys))
+
+    def search(self, text: str) -> 'SpellNameMatches':
+        '''Returns the spells whose names start with text, ignoring case.'''
+        key = text.casefold()
+        (last_key, low, high) = self.last_search
+        if not key.startswith(last_key):
+            (low, high) = (0, len(self.keys))
+        start = bisect_left(self.keys, key, low, high)
+        stop = bisect_left(self.keys, key + self.max_char, start, high)
+        self.last_search = (key, start, stop)
+        return SpellNameMatches(self.rows, start, stop)
+
+
+class SpellNameMatches:
+    '''The result of a SpellNameIndex search, a range of its rows.'''
+    def __init__(self, rows: list[tuple[int, str]], start: int, stop: int):
+        self.all_rows = rows
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def rows(self, start: int, stop: int) -> list[tuple[int, str]]:
+        '''Returns the matches at positions start to stop - 1.'''
+        stop = min(stop, len(self))
+        return self.all_rows[self.start + start:self.start + stop]
+
+
 if __name__ == '__main__':
     spell_db = SpellDataBase(
         'test.sqlite3', schema_filename='spell_db_schema.sql')
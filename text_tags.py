@@ -0,0 +1,197 @@
+# spell-book - A GUI for managing spells in D&D 5e
+#    Copyright (C) 2023  briforsaur
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#   
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#   
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+Types and conversions for the formatting tags of spell text.
+
+Tags are represented by TagSpans, which stores the ranges of each tag 
+as integer character offsets into the text. Older code and older 
+databases use a TagDict, which maps each tag name to a list of the 
+[start, end] Tk text indices (such as '1.0' or '2.15') of the ranges 
+the tag is applied to; TagSpans converts from and to that format. This
+module does not depend on tkinter, so that spells can be handled 
+without a display.
+'''
+import json
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterator
+
+TagRange = list[str,str]
+TagDict = dict[str,list[TagRange]]
+
+
+def get_line_starts(text: str) -> list[int]:
+    '''Returns the offset of the first character of each line of text.'''
+    line_starts = [0]
+    start = text.find('\n')
+    while start >= 0:
+        line_starts.append(start + 1)
+        start = text.find('\n', start + 1)
+    return line_starts
+
+
+def index_to_offset(index: str, line_starts: list[int], text: str) -> int:
+    '''
+    Converts a Tk text index such as '2.5' to a character offset.
+
+    The index may use 'end' as its character part to refer to the end
+    of the line, as created by create_tagrange. Indices past the last 
+    line, such as the 'end' index of a text box with its final newline,
+    are clamped to the end of the text.
+    '''
+    (line, char) = index.split('.')
+    line = int(line) - 1
+    if line >= len(line_starts):
+        return len(text)
+    if char == 'end':
+        if line + 1 < len(line_starts):
+            return line_starts[line + 1] - 1
+        return len(text)
+    return line_starts[line] + int(char)
+
+
+def offset_to_index(offset: int, line_starts: list[int]) -> str:
+    '''Converts a character offset to a Tk text index such as '2.5'.'''
+    line = bisect_right(line_starts, offset) - 1
+    return f'{line + 1}.{offset - line_starts[line]}'
+
+
+class TagSpans:
+    '''
+    The formatting tags of a text, as integer character offsets.
+
+    The ranges of each tag are stored in an array of unsigned integers
+    holding the start and end offsets of every range in turn, so 
+    {'bold': array('I', [0, 5, 10, 12])} applies the bold tag to the
+    characters 0 to 4 and 10 to 11. Unlike Tk indices, offsets do not
+    depend on where the lines of the text break, so moving tags along
+    with their text is a single addition per offset (see shifted and 
+    update).
+
+    TagSpans are converted from and to the TagDicts of Tk indices used
+    by older code with from_tag_dict and to_tag_dict, and are stored in
+    the database as JSON with to_json. decode reads either format.
+
+    Example:
+    text = 'Fireball\\nA bright streak...'
+    spans = TagSpans.from_tag_dict(text, {'bold': [['1.0', '1.8']]})
+    spans.shifted(4)  # TagSpans({'bold': [4, 12]})
+    '''
+    __slots__ = ('spans',)
+
+    def __init__(self, spans: dict[str, array] = None):
+        self.spans: dict[str, array] = spans if spans is not None else {}
+
+    @classmethod
+    def from_tag_dict(cls, text: str, tag_dict: TagDict) -> 'TagSpans':
+        '''Converts a TagDict of Tk indices into text to TagSpans.'''
+        line_starts = get_line_starts(text)
+        return cls({
+            tag: array('I', [
+                index_to_offset(index, line_starts, text) 
+                for tag_range in tag_ranges for index in tag_range
+            ])
+            for (tag, tag_ranges) in tag_dict.items()
+        })
+
+    @classmethod
+    def decode(cls, value: 'TagSpans | TagDict | dict | str', text: str
+            ) -> 'TagSpans':
+        '''
+        Converts tags in any stored format to TagSpans.
+
+        value can be TagSpans, a dictionary of offset lists as written 
+        by to_json, a TagDict of Tk indices into text, or either 
+        dictionary encoded as a JSON string.
+        '''
+        if isinstance(value, TagSpans):
+            return value
+        if isinstance(value, str):
+            value = json.loads(value)
+        ranges = next((r for r in value.values() if r), None)
+        if ranges is not None and not isinstance(ranges[0], int):
+            return cls.from_tag_dict(text, value)
+        return cls({tag: array('I', offsets) for (tag, offsets) in value.items()})
+
+    def to_tag_dict(self, text: str) -> TagDict:
+        '''Converts the spans to a TagDict of Tk indices into text.'''
+        line_starts = get_line_starts(text)
+        tag_dict = {}
+        for (tag, offsets) in self.spans.items():
+            indices = [offset_to_index(offset, line_starts) for offset in offsets]
+            tag_dict[tag] = [list(pair) for pair in zip(indices[::2], indices[1::2])]
+        return tag_dict
+
+    def to_json(self) -> str:
+        '''Encodes the spans as a JSON object of offset lists.'''
+        return json.dumps(self.to_dict())
+
+    def to_dict(self) -> dict[str, list[int]]:
+        return {tag: offsets.tolist() for (tag, offsets) in self.spans.items()}
+
+    def add(self, tag: str, start: int, end: int):
+        '''Applies tag to the characters from start up to end.'''
+        self.spans.setdefault(tag, array('I')).extend((start, end))
+
+    def ranges(self, tag: str) -> Iterator[tuple[int, int]]:
+        '''Yields the (start, end) offsets of each range of a tag.'''
+        offsets = self.spans.get(tag, ())
+        return zip(offsets[::2], offsets[1::2])
+
+    def shifted(self, offset: int) -> 'TagSpans':
+        '''
+        Returns a copy with every range moved by offset characters.
+
+        This is used when the text of the tags is placed after offset
+        characters of other text.
+        '''
+        return TagSpans({
+            tag: array('I', [position + offset for position in offsets])
+            for (tag, offsets) in self.spans.items()
+        })
+
+    def update(self, other: 'TagSpans', offset: int = 0):
+        '''
+        Adds the ranges of other, moved by offset characters, to these.
+
+        This merges the tags of two texts that are joined together, 
+        where offset is the length of the text before the other text.
+        '''
+        if offset:
+            other = other.shifted(offset)
+        for (tag, offsets) in other.spans.items():
+            self.spans.setdefault(tag, array('I')).extend(offsets)
+
+    def copy(self) -> 'TagSpans':
+        return TagSpans({
+            tag: array('I', offsets) for (tag, offsets) in self.spans.items()
+        })
+
+    def items(self):
+        return self.spans.items()
+
+    def __bool__(self) -> bool:
+        return any(self.spans.values())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TagSpans):
+            return NotImplemented
+        return self.spans == other.spans
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f'TagSpans({self.to_dict()!r})'